@@ -0,0 +1,160 @@
+"""
+ascii_cache.py
+
+Parsing a big Cactus ASCII file is slow, and we tend to parse the same
+files over and over again. This little library saves the parsed
+columns of a file in a binary sidecar next to the file, so the next
+time the file is loaded we can skip the text parse entirely.
+----------------------------------------------------------------------
+
+For a file
+
+/path/to/admbase::metric.x.asc
+
+the sidecar is the directory
+
+/path/to/admbase::metric.x.asc.cache/
+
+It can hold several kinds of cached data. Each kind is a set of .npy
+files, one per column,
+
+kind.column_name.npy
+
+plus a small manifest, kind.json, that records the path, size and
+modification time of the source file along with the name, dtype and
+shape of every column. The .npy files can be memory-mapped, so
+loading a sidecar costs almost nothing until the data is used.
+
+The manifest is written last. A sidecar with no manifest, with a
+manifest that doesn't match the source file, or with a column that
+doesn't match the manifest is stale, and it is rebuilt automatically.
+
+If the sidecar can't be written (for example, if the data lives in a
+read-only directory), we silently go without.
+"""
+
+# Imports
+# ----------------------------------------------------------------------
+import os # File system tools
+import json # For the manifest
+import numpy as np # For arrays
+# ----------------------------------------------------------------------
+
+# Global constants
+# ----------------------------------------------------------------------
+CACHE_SUFFIX = '.cache'
+MANIFEST_SUFFIX = '.json'
+COLUMN_SUFFIX = '.npy'
+# Bump this whenever the layout of cached data changes. Old sidecars
+# are then rebuilt.
+CACHE_VERSION = 1
+WARNING_MESSAGE = "This is a library. You are only supposed to import it!"
+# ----------------------------------------------------------------------
+
+def cache_directory(filename):
+    "Returns the path to the sidecar directory for filename."
+    return filename + CACHE_SUFFIX
+
+def manifest_path(filename,kind):
+    "Returns the path to the manifest of the given kind of cached data."
+    return os.path.join(cache_directory(filename),kind + MANIFEST_SUFFIX)
+
+def column_path(filename,kind,name):
+    "Returns the path to the .npy file for one cached column."
+    return os.path.join(cache_directory(filename),
+                        kind + '.' + name + COLUMN_SUFFIX)
+
+def source_signature(filename):
+    """
+    Returns the information the sidecar is keyed on: the absolute path
+    to the source file, its size in bytes, and its modification time.
+    """
+    status = os.stat(filename)
+    return {'source' : os.path.abspath(filename),
+            'size' : status.st_size,
+            'mtime' : status.st_mtime}
+
+def read_manifest(filename,kind):
+    """
+    Returns the manifest for the given kind of cached data, or None if
+    there isn't a readable manifest.
+    """
+    try:
+        with open(manifest_path(filename,kind),'r') as f:
+            return json.load(f)
+    except (IOError,OSError,ValueError):
+        return None
+
+def is_fresh(manifest,filename):
+    """
+    True if manifest describes a complete sidecar for the current
+    version of filename.
+    """
+    if manifest is None or manifest.get('version') != CACHE_VERSION:
+        return False
+    signature = source_signature(filename)
+    return all(manifest.get(key) == signature[key] for key in signature)
+
+def load_arrays(filename,kind):
+    """
+    Loads the given kind of cached data for filename. Returns a
+    dictionary mapping column names to memory-mapped arrays, or None
+    if the sidecar is missing, stale or damaged.
+    """
+    manifest = read_manifest(filename,kind)
+    if not is_fresh(manifest,filename):
+        return None
+    arrays = {}
+    try:
+        for name,description in manifest['columns'].items():
+            array = np.load(column_path(filename,kind,name),mmap_mode='r')
+            if array.dtype.str != description['dtype'] \
+                    or list(array.shape) != description['shape']:
+                return None
+            arrays[name] = array
+    except (IOError,OSError,ValueError,KeyError):
+        return None
+    return arrays
+
+def save_arrays(filename,kind,arrays):
+    """
+    Saves a dictionary of arrays as the given kind of cached data for
+    filename. Every file is written under a temporary name and then
+    renamed, and the manifest goes last, so a reader never sees a
+    half-written sidecar as fresh.
+
+    Returns True if the sidecar was written.
+    """
+    directory = cache_directory(filename)
+    suffix = '.tmp{}'.format(os.getpid())
+    try:
+        if not os.path.isdir(directory):
+            os.mkdir(directory)
+        # Invalidate any old sidecar before touching its columns
+        if os.path.exists(manifest_path(filename,kind)):
+            os.remove(manifest_path(filename,kind))
+        signature = source_signature(filename)
+        columns = {}
+        for name,array in arrays.items():
+            array = np.ascontiguousarray(array)
+            path = column_path(filename,kind,name)
+            with open(path + suffix,'wb') as f:
+                np.save(f,array)
+            os.rename(path + suffix,path)
+            columns[name] = {'dtype' : array.dtype.str,
+                             'shape' : list(array.shape)}
+        manifest = dict(signature)
+        manifest['version'] = CACHE_VERSION
+        manifest['columns'] = columns
+        path = manifest_path(filename,kind)
+        with open(path + suffix,'w') as f:
+            json.dump(manifest,f)
+        os.rename(path + suffix,path)
+    except (IOError,OSError):
+        return False
+    # The source changed while we were writing. Don't trust the result.
+    return source_signature(filename) == signature
+
+
+if __name__=="__main__":
+    raise ImportWarning(WARNING_MESSAGE)
@@ -0,0 +1,405 @@
+"""
+carpet_hdf5.py
+
+Reads the HDF5 output of CarpetIOHDF5 into the same Snapshots store
+(see extract_tensor_data.py) that we build from CarpetIOASCII
+output. extract_tensor_data.extract_data, iterate_snapshots and the
+extract_snapshot* functions hand HDF5 files to this library, so
+everything built on them works on HDF5 runs without changes.
+----------------------------------------------------------------------
+
+A Carpet HDF5 file holds one dataset per variable, iteration, time
+level, refinement level and component, named like
+
+ADMBASE::gxx it=128 tl=0 rl=1 c=3
+
+(with an extra m=N for multipatch runs). The attributes of each
+dataset give the coordinate time, the grid index of its first point
+(iorigin), the position of its first point (origin), the lattice
+spacing (delta) and the ghost zones.
+
+Each point of each dataset becomes a row of the store, with the same
+columns as a CarpetIOASCII file: the data columns are the variables
+in the file, sorted by name (so gxx,gxy,...,gzz come out in the usual
+order), and the metadata columns come from the dataset names and
+attributes. Along axes the output doesn't cover (y and z for a .x.h5
+file) the grid index and coordinate are those of the line, if the
+attributes give them for all three axes, and 0 otherwise.
+
+Only the datasets we ask for are ever read. The variables, time
+levels, refinement levels and snapshots we want are picked out by the
+names of the datasets, and the time windows by their attributes,
+before any data is read. When duplicate points are removed anyway,
+each dataset is read through a hyperslab that leaves out the ghost
+zones it shares with its neighbours.
+
+Needs h5py.
+"""
+
+# Imports
+# ----------------------------------------------------------------------
+import os # File system tools
+import re # To read dataset names
+import numpy as np # For arrays
+from collections import namedtuple
+try:
+    import h5py # For HDF5 files
+except ImportError:
+    h5py = None
+import extract_tensor_data as etd # For the store
+# ----------------------------------------------------------------------
+
+# Global constants
+# ----------------------------------------------------------------------
+HDF5_SUFFIXES = ['.h5','.hdf5']
+HDF5_MAGIC = b'\x89HDF\r\n\x1a\n'
+# Names of the datasets that hold grid functions
+DATASET_NAME = re.compile(r'^(?P<variable>\S+) it=(?P<it>\d+) tl=(?P<tl>\d+)'
+                          r'(?: m=(?P<m>\d+))? rl=(?P<rl>\d+)'
+                          r'(?: c=(?P<c>\d+))?$')
+# The axes an output file covers, from the end of its name, like
+# admbase::metric.xy.h5
+OUTPUT_AXES = re.compile(r'\.([xyz]+)\.h(?:df)?5$')
+AXIS_NUMBERS = {'x' : 0, 'y' : 1, 'z' : 2}
+# We only read the current time level, as CarpetIOASCII writes it
+TIME_LEVEL = 0
+# Stands for etd.DUPLICATE_RULE, which is looked up when we're called.
+# (extract_tensor_data imports this library, so it can't be a default
+# argument. None already means keep every row.)
+DEFAULT_DUPLICATES = 'default'
+# One dataset, described by its name
+DatasetKey = namedtuple('DatasetKey',['name','variable','it','tl','rl','c','m'])
+WARNING_MESSAGE = "This is a library. You are only supposed to import it!"
+# ----------------------------------------------------------------------
+
+def is_hdf5(filename):
+    """
+    True if filename is an HDF5 file, by its extension or, if the
+    extension doesn't say, by its magic bytes.
+    """
+    if any(filename.endswith(suffix) for suffix in HDF5_SUFFIXES):
+        return True
+    if not os.path.isfile(filename):
+        return False
+    with open(filename,'rb') as f:
+        return f.read(len(HDF5_MAGIC)) == HDF5_MAGIC
+
+def open_file(filename):
+    "Opens an HDF5 file for reading."
+    if h5py is None:
+        raise ImportError("Reading {} needs the h5py module.".format(filename))
+    return h5py.File(filename,'r')
+
+def variable_name(variable):
+    """
+    Takes the full name of a variable, like ADMBASE::gxx, and returns
+    the name of its data column, gxx.
+    """
+    return variable.split('::')[-1]
+
+def list_datasets(f,levels=None):
+    """
+    Returns a DatasetKey for every grid function dataset of the
+    current time level in the open file f, sorted by iteration,
+    refinement level, map, component and variable. levels is a list
+    of the refinement levels we want, or None for all of them.
+    """
+    keys = []
+    for name in f.keys():
+        match = DATASET_NAME.match(name)
+        if match is None or int(match.group('tl')) != TIME_LEVEL:
+            continue
+        rl = int(match.group('rl'))
+        if levels is not None and rl not in levels:
+            continue
+        keys.append(DatasetKey(name,match.group('variable'),
+                               int(match.group('it')),TIME_LEVEL,rl,
+                               int(match.group('c') or 0),
+                               int(match.group('m') or 0)))
+    keys.sort(key=lambda key: (key.it,key.rl,key.m,key.c,key.variable))
+    return keys
+
+def make_schema(keys):
+    """
+    Builds the Schema (see extract_tensor_data.py) of a file from the
+    DatasetKeys of its datasets.
+    """
+    variables = sorted(set(key.variable for key in keys))
+    return etd.make_schema(data_columns=[variable_name(variable) \
+                                             for variable in variables])
+
+def read_schema(filename):
+    "Returns the Schema of an HDF5 file."
+    with open_file(filename) as f:
+        return make_schema(list_datasets(f))
+
+def group_by_iteration(keys):
+    """
+    Splits keys, sorted as list_datasets sorts them, into one list of
+    DatasetKeys per iteration, in order.
+    """
+    groups = []
+    for key in keys:
+        if not groups or key.it != groups[-1][0].it:
+            groups.append([])
+        groups[-1].append(key)
+    return groups
+
+def make_index(f,keys):
+    """
+    Returns the distinct iterations in keys, in order, and the
+    coordinate time of each of them, read from the attributes of one
+    dataset per iteration. No data is read.
+    """
+    iterations = []
+    times = []
+    for key in keys:
+        if not iterations or key.it != iterations[-1]:
+            iterations.append(key.it)
+            times.append(float(f[key.name].attrs['time']))
+    return np.array(iterations,dtype=np.int64),np.array(times)
+
+def get_iteration_index(filename,levels=None):
+    """
+    Returns a dictionary with the iterations and times of every
+    snapshot in filename, like the one get_iteration_offsets makes for
+    an ASCII file, but without offsets.
+    """
+    with open_file(filename) as f:
+        iterations,times = make_index(f,list_datasets(f,levels))
+    return {'iterations' : iterations, 'times' : times}
+
+def output_axes(filename,ndim):
+    """
+    Returns the spatial axes (0=x,1=y,2=z) the ndim dimensions of the
+    datasets in filename stand for, from fastest to slowest varying.
+    """
+    match = OUTPUT_AXES.search(filename)
+    if ndim < 3 and match and len(match.group(1)) == ndim:
+        return [AXIS_NUMBERS[axis] for axis in match.group(1)]
+    return list(range(ndim))
+
+def per_axis(values,axes):
+    """
+    Takes an attribute with one value per spatial axis (or one per
+    axis of the dataset) and returns the values for axes.
+    """
+    values = np.atleast_1d(values)
+    if len(values) == len(axes):
+        return values
+    return values[axes]
+
+def hyperslab(dataset,axes,trim_ghosts):
+    """
+    Returns the slices of the hyperslab of dataset we read, one per
+    axis in axes, from fastest to slowest varying.
+
+    If trim_ghosts is true, ghost zones are left out on every face
+    that isn't an outer boundary, since a neighbouring component owns
+    those points. Otherwise (or if the attributes don't say where the
+    ghost zones are) the whole dataset is read.
+    """
+    shape = dataset.shape[::-1]
+    slices = [slice(0,n) for n in shape]
+    attrs = dataset.attrs
+    if not trim_ghosts or 'cctk_nghostzones' not in attrs \
+            or 'cctk_bbox' not in attrs:
+        return slices
+    ghosts = per_axis(attrs['cctk_nghostzones'],axes)
+    bbox = np.atleast_1d(attrs['cctk_bbox'])
+    if len(bbox) == 2*len(axes):
+        lower,upper = bbox[0::2],bbox[1::2]
+    else:
+        lower,upper = bbox[0::2][axes],bbox[1::2][axes]
+    for k in range(len(axes)):
+        start = 0 if lower[k] else ghosts[k]
+        stop = shape[k] if upper[k] else shape[k] - ghosts[k]
+        if start < stop:
+            slices[k] = slice(start,stop)
+    return slices
+
+def block_of(key):
+    """
+    Returns what tells the blocks of datasets apart. A block is one
+    component of one map on one refinement level at one iteration.
+    """
+    return key.it,key.rl,key.m,key.c
+
+def off_axis_value(attrs,name,axis):
+    """
+    Returns the value of the index or position column name along an
+    axis the dataset doesn't cover, or 0 if attrs don't say.
+    """
+    attribute = 'iorigin' if name in etd.INDEX_COLUMNS else 'origin'
+    values = np.atleast_1d(attrs[attribute])
+    if len(values) == len(etd.POSITION_COLUMNS):
+        return values[axis]
+    return 0
+
+def read_block(f,keys,names,axes,trim_ghosts):
+    """
+    Reads one block of datasets (see block_of). keys are the
+    DatasetKeys of its variables, and names are the columns we want
+    (the names in etd.METADATA_COLUMNS and the data column
+    names). Returns a dictionary mapping each name in names to a
+    one-dimensional array.
+    """
+    first = f[keys[0].name]
+    slices = hyperslab(first,axes,trim_ghosts)
+    # h5py wants the slowest varying axis first
+    selection = tuple(slices[::-1])
+    shape = tuple(s.stop - s.start for s in slices)
+    num_points = int(np.prod(shape))
+    attrs = first.attrs
+    iorigin = per_axis(attrs['iorigin'],axes)
+    origin = per_axis(attrs['origin'],axes)
+    delta = per_axis(attrs['delta'],axes)
+    # indices[k] is the index along axes[k] of each point, with the
+    # first axis varying fastest, as in CarpetIOASCII output
+    indices = np.indices(shape[::-1]).reshape(len(shape),-1)[::-1]
+    columns = {}
+    for name in etd.METADATA_COLUMNS:
+        if name not in names:
+            continue
+        if name == 'it':
+            value = keys[0].it
+        elif name == 'tl':
+            value = keys[0].tl
+        elif name == 'rl':
+            value = keys[0].rl
+        elif name == 'c':
+            value = keys[0].c
+        elif name == 'time':
+            value = float(attrs['time'])
+        elif name in etd.INDEX_COLUMNS or name in etd.POSITION_COLUMNS:
+            axis = AXIS_NUMBERS[name[-1]]
+            if axis not in axes:
+                value = off_axis_value(attrs,name,axis)
+            else:
+                k = axes.index(axis)
+                index = indices[k] + slices[k].start
+                if name in etd.INDEX_COLUMNS:
+                    columns[name] = index + iorigin[k]
+                else:
+                    columns[name] = origin[k] + delta[k]*index
+                continue
+        else:
+            value = 0
+        columns[name] = np.full(num_points,value,dtype=float)
+    for key in keys:
+        name = variable_name(key.variable)
+        if name in names:
+            columns[name] = np.asarray(f[key.name][selection]).ravel()
+    return columns
+
+def read_snapshots(f,keys,schema,axes,duplicates):
+    """
+    Reads the datasets in keys and builds a Snapshots store with the
+    columns in schema, which is the file schema, or a projection of
+    it (see etd.project_schema).
+    """
+    usecols,compact = etd.compact_schema(schema)
+    column_names = {}
+    for name,column in schema.metadata.items():
+        column_names[column] = name
+    for name,column in zip(schema.data_names,schema.data_columns):
+        column_names[column] = name
+    names = [column_names[column] for column in usecols]
+    tables = []
+    start = 0
+    while start < len(keys):
+        stop = start
+        while stop < len(keys) \
+                and block_of(keys[stop]) == block_of(keys[start]):
+            stop += 1
+        columns = read_block(f,keys[start:stop],names,axes,
+                             duplicates is not None)
+        tables.append(np.column_stack([columns[name] for name in names]))
+        start = stop
+    if not tables:
+        return etd.make_snapshots(np.zeros((0,len(names))),compact)
+    return etd.make_snapshots(np.concatenate(tables),compact)
+
+def select_keys(f,filename,duplicates,components,fields,levels):
+    """
+    Lists the datasets of the open file f (named filename) that hold
+    the components and levels we want, as in extract_data. Returns
+    their DatasetKeys, the Schema to read them with (see
+    read_snapshots) and the spatial axes of the datasets.
+    """
+    keys = list_datasets(f,levels)
+    schema = make_schema(keys)
+    projected = etd.project_schema(schema,components,fields,duplicates)
+    wanted = set(etd.component_name(schema,component) \
+                     for component in components) \
+                     if components is not None else None
+    keys = [key for key in keys \
+                if wanted is None or variable_name(key.variable) in wanted]
+    axes = output_axes(filename,len(f[keys[0].name].shape)) if keys else []
+    return keys,projected,axes
+
+def extract_data(filename,duplicates=DEFAULT_DUPLICATES,components=None,
+                 fields=None,iterations=None,times=None,levels=None):
+    """
+    Extracts the data from a Carpet HDF5 file into a Snapshots
+    store. duplicates, components, fields, iterations and times are as
+    in etd.extract_data. levels is a list of the refinement levels we
+    want, or None for all of them.
+
+    Raises a ValueError if no snapshot is in the windows.
+    """
+    if duplicates == DEFAULT_DUPLICATES:
+        duplicates = etd.DUPLICATE_RULE
+    with open_file(filename) as f:
+        keys,projected,axes = select_keys(f,filename,duplicates,components,
+                                          fields,levels)
+        if iterations is not None or times is not None:
+            index_iterations,index_times = make_index(f,keys)
+            selected = index_iterations[etd.select_window(index_iterations,
+                                                          index_times,
+                                                          iterations,times)]
+            selected = set(selected.tolist())
+            keys = [key for key in keys if key.it in selected]
+        if not keys:
+            raise ValueError("{} has no snapshots in the window.".format(filename))
+        data = read_snapshots(f,keys,projected,axes,duplicates)
+    return etd.deduplicate(data,duplicates)
+
+def iterate_snapshots(filename,duplicates=DEFAULT_DUPLICATES,
+                      components=None,fields=None,levels=None):
+    """
+    A generator version of extract_data. Reads the file one iteration
+    at a time and yields each snapshot in turn as a Snapshot. The file
+    is opened and its datasets listed only once.
+    """
+    if duplicates == DEFAULT_DUPLICATES:
+        duplicates = etd.DUPLICATE_RULE
+    with open_file(filename) as f:
+        keys,projected,axes = select_keys(f,filename,duplicates,components,
+                                          fields,levels)
+        for group in group_by_iteration(keys):
+            data = read_snapshots(f,group,projected,axes,duplicates)
+            yield etd.deduplicate(data,duplicates)[0]
+
+def extract_snapshot(filename,index,duplicates=DEFAULT_DUPLICATES,
+                     components=None,fields=None,levels=None):
+    """
+    Returns only the index-th snapshot in filename (the snapshot
+    index, not the iteration number).
+    """
+    if duplicates == DEFAULT_DUPLICATES:
+        duplicates = etd.DUPLICATE_RULE
+    with open_file(filename) as f:
+        keys,projected,axes = select_keys(f,filename,duplicates,components,
+                                          fields,levels)
+        groups = group_by_iteration(keys)
+        if index < 0:
+            index += len(groups)
+        if not 0 <= index < len(groups):
+            raise IndexError("{} has no snapshot {}".format(filename,index))
+        data = read_snapshots(f,groups[index],projected,axes,duplicates)
+    return etd.deduplicate(data,duplicates)[0]
+
+
+if __name__=="__main__":
+    raise ImportWarning(WARNING_MESSAGE)
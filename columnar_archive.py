@@ -0,0 +1,340 @@
+"""
+columnar_archive.py
+
+A compact binary archive for the output of finished simulations, so
+analyses don't have to parse the ASCII again. convert_simulation.py
+writes the archives. extract_tensor_data.py reads them, so every
+reader built on it opens an archived table exactly like the file it
+came from.
+----------------------------------------------------------------------
+
+An archive is a directory, one per simulation,
+
+/path/to/simulation.archive/
+
+holding one table per output file. A table is all the snapshots of
+that file, with the restarts stitched together (see
+simfactory_interface.Timeline) and every row kept, like
+
+/path/to/simulation.archive/admbase::metric.x.columns/
+
+A table is a directory with one .npy file per column and a manifest,
+manifest.json. The manifest holds the schema, the iteration and time
+of every snapshot, the path, size and modification time of every
+source file, and how each column is stored:
+
+--- 'plain' columns are stored as they are, in the smallest dtype
+    that holds them. The grid indices, refinement level, component
+    and the like fit in int8 or int16.
+--- 'lookup' columns are stored as a table of their distinct values
+    (name.values.npy) and one small unsigned integer per row
+    (name.codes.npy). Time and the coordinates take few distinct
+    values, so they shrink the most.
+
+The data columns are always stored plain, as 64 bit floats.
+
+Reading a table decodes every column it needs back into the 64 bit
+types extract_tensor_data uses. Only the columns and rows we ask for
+are decoded.
+
+A table is written under a temporary name and renamed when it's
+complete, so a half-written table is never seen. A table whose
+sources haven't changed is current, and rewriting it is a no-op.
+"""
+
+# Imports
+# ----------------------------------------------------------------------
+import os # File system tools
+import shutil # To replace old tables
+import glob # To find tables left half-written
+import json # For the manifest
+from collections import namedtuple # For open tables
+import numpy as np # For arrays
+import ascii_cache # For the signatures of source files
+import extract_tensor_data as etd # For the store
+# ----------------------------------------------------------------------
+
+# Global constants
+# ----------------------------------------------------------------------
+ARCHIVE_SUFFIX = '.archive'
+TABLE_SUFFIX = '.columns'
+MANIFEST_NAME = 'manifest.json'
+COLUMN_SUFFIX = '.npy'
+VALUES_SUFFIX = '.values'
+CODES_SUFFIX = '.codes'
+TEMPORARY_SUFFIX = '.tmp'
+PLAIN = 'plain'
+LOOKUP = 'lookup'
+# Bump this whenever the layout of a table changes
+ARCHIVE_VERSION = 1
+# Floating point metadata columns are stored as lookups if they have
+# at most this fraction as many distinct values as rows
+MAX_LOOKUP_FRACTION = 0.5
+# The dtypes we try for integer columns and codes, smallest first
+SIGNED_DTYPES = [np.int8,np.int16,np.int32,np.int64]
+UNSIGNED_DTYPES = [np.uint8,np.uint16,np.uint32,np.uint64]
+# The default for duplicates, replaced by etd.DUPLICATE_RULE at call
+# time (see carpet_hdf5.DEFAULT_DUPLICATES)
+DEFAULT_DUPLICATES = 'default'
+# A table opened for reading (see open_table)
+Table = namedtuple('Table',['directory','schema','projected','iterations',
+                            'times','offsets','columns','data','wanted'])
+WARNING_MESSAGE = "This is a library. You are only supposed to import it!"
+# ----------------------------------------------------------------------
+
+def archive_directory(root_dir_name):
+    "Returns the path to the archive of the simulation in root_dir_name."
+    return root_dir_name.rstrip('/') + ARCHIVE_SUFFIX
+
+def table_name(file_name):
+    """
+    Returns the name of the table for the output file file_name, like
+    admbase::metric.x.columns for admbase::metric.x.asc.
+    """
+    return os.path.splitext(file_name)[0] + TABLE_SUFFIX
+
+def manifest_path(directory):
+    "Returns the path to the manifest of the table in directory."
+    return os.path.join(directory,MANIFEST_NAME)
+
+def is_table(filename):
+    "True if filename is a table of an archive."
+    return os.path.isdir(filename) and os.path.isfile(manifest_path(filename))
+
+def read_manifest(directory):
+    """
+    Returns the manifest of the table in directory, or None if there
+    isn't a readable one.
+    """
+    try:
+        with open(manifest_path(directory),'r') as f:
+            return json.load(f)
+    except (IOError,OSError,ValueError):
+        return None
+
+def is_current(directory,sources):
+    """
+    True if directory holds a complete table made from the current
+    versions of the files in sources.
+    """
+    manifest = read_manifest(directory)
+    if manifest is None or manifest.get('version') != ARCHIVE_VERSION:
+        return False
+    try:
+        signatures = [ascii_cache.source_signature(path) for path in sources]
+    except OSError:
+        return False
+    return manifest['sources'] == signatures
+
+def smallest_dtype(values,dtypes):
+    """
+    Returns the first of dtypes that can hold every one of values.
+    """
+    if len(values) == 0:
+        return dtypes[0]
+    low,high = values.min(),values.max()
+    for dtype in dtypes:
+        if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+            return dtype
+    return dtypes[-1]
+
+def encode_column(values):
+    """
+    Takes a metadata column and returns (description,arrays).
+    description says how the column is stored, and arrays maps a
+    suffix for each .npy file to the array to write.
+    """
+    if values.dtype.kind in 'iu':
+        dtype = smallest_dtype(values,SIGNED_DTYPES)
+        return {'encoding' : PLAIN}, {'' : values.astype(dtype)}
+    distinct,codes = np.unique(values,return_inverse=True)
+    if len(distinct) > MAX_LOOKUP_FRACTION*max(len(values),1):
+        return {'encoding' : PLAIN}, {'' : values}
+    codes = codes.astype(smallest_dtype(codes,UNSIGNED_DTYPES))
+    return {'encoding' : LOOKUP}, {VALUES_SUFFIX : distinct,
+                                   CODES_SUFFIX : codes}
+
+def load_column(directory,name,description):
+    """
+    Memory-maps the arrays the column name of the table in directory
+    is stored as (see encode_column) and returns them by suffix.
+    Nothing but the lookup values is read yet.
+    """
+    def load(suffix):
+        return np.load(os.path.join(directory,name + suffix + COLUMN_SUFFIX),
+                       mmap_mode='r')
+    if description['encoding'] == LOOKUP:
+        return {VALUES_SUFFIX : np.asarray(load(VALUES_SUFFIX)),
+                CODES_SUFFIX : load(CODES_SUFFIX)}
+    return {'' : load('')}
+
+def decode_column(name,arrays,rows):
+    """
+    Decodes the rows we want of the column name, stored as arrays (see
+    load_column), back into the type extract_tensor_data uses for
+    it. rows is a slice or an index array.
+    """
+    if CODES_SUFFIX in arrays:
+        return arrays[VALUES_SUFFIX][arrays[CODES_SUFFIX][rows]]
+    dtype = np.int64 if name in etd.INTEGER_COLUMNS else float
+    return np.array(arrays[''][rows],dtype=dtype)
+
+def write_table(directory,data,sources):
+    """
+    Writes the Snapshots store data as a table in directory, replacing
+    whatever was there. sources are the files the data came from.
+
+    Half-written copies of the table, left behind by a write that was
+    interrupted, are removed first. So don't write the same table from
+    two processes at once.
+    """
+    for leftover in glob.glob(directory + TEMPORARY_SUFFIX + '*'):
+        shutil.rmtree(leftover,ignore_errors=True)
+    temporary = directory + TEMPORARY_SUFFIX + str(os.getpid())
+    os.makedirs(temporary)
+    columns = {}
+    for name,values in data.columns.items():
+        description,arrays = encode_column(np.asarray(values))
+        for suffix,array in arrays.items():
+            np.save(os.path.join(temporary,name + suffix + COLUMN_SUFFIX),
+                    array)
+        columns[name] = description
+    np.save(os.path.join(temporary,'data' + COLUMN_SUFFIX),
+            np.ascontiguousarray(data.data,dtype=float))
+    np.save(os.path.join(temporary,'offsets' + COLUMN_SUFFIX),
+            np.asarray(data.offsets,dtype=np.int64))
+    manifest = {'version' : ARCHIVE_VERSION,
+                'sources' : [ascii_cache.source_signature(path) \
+                                 for path in sources],
+                'schema' : dict(data.schema._asdict()),
+                'columns' : columns,
+                'iterations' : [int(it) for it in data.iterations],
+                'times' : [float(time) for time in data.times()]}
+    with open(manifest_path(temporary),'w') as f:
+        json.dump(manifest,f)
+    if os.path.isdir(directory):
+        shutil.rmtree(directory)
+    os.rename(temporary,directory)
+
+def read_schema(directory):
+    "Returns the Schema of the table in directory."
+    return manifest_schema(read_manifest(directory))
+
+def manifest_schema(manifest):
+    "Returns the Schema stored in the manifest of a table."
+    schema = manifest['schema']
+    metadata = {str(name) : column \
+                    for name,column in schema['metadata'].items()}
+    return etd.Schema(metadata,schema['data_columns'],
+                      [str(name) for name in schema['data_names']],
+                      str(schema['kind']))
+
+def get_iteration_index(directory):
+    """
+    Returns a dictionary with the iterations and times of every
+    snapshot in the table, like the one get_iteration_offsets makes
+    for an ASCII file, but without byte offsets.
+    """
+    manifest = read_manifest(directory)
+    return {'iterations' : np.array(manifest['iterations'],dtype=np.int64),
+            'times' : np.array(manifest['times'],dtype=float)}
+
+def open_table(directory,duplicates,components,fields):
+    """
+    Reads the manifest and offsets of the table in directory once and
+    memory-maps the columns we need for components and fields (as in
+    extract_data), so any of its snapshots can be read without
+    loading anything again (see read_table). Returns a Table.
+    """
+    manifest = read_manifest(directory)
+    schema = manifest_schema(manifest)
+    projected = etd.project_schema(schema,components,fields,duplicates)
+    offsets = np.load(os.path.join(directory,'offsets' + COLUMN_SUFFIX))
+    columns = {name : load_column(directory,name,manifest['columns'][name]) \
+                   for name in projected.metadata}
+    data = np.load(os.path.join(directory,'data' + COLUMN_SUFFIX),
+                   mmap_mode='r')
+    wanted = [schema.data_names.index(name) for name in projected.data_names]
+    return Table(directory,schema,projected,
+                 np.array(manifest['iterations'],dtype=np.int64),
+                 np.array(manifest['times'],dtype=float),
+                 offsets,columns,data,wanted)
+
+def read_table(table,selected):
+    """
+    Reads the snapshots of the open Table table with the indices in
+    selected (in order) into a Snapshots store. A run of consecutive
+    snapshots is read as one slice of each column.
+    """
+    offsets = table.offsets
+    first,last = selected[0],selected[-1]
+    if last - first == len(selected) - 1:
+        rows = slice(offsets[first],offsets[last+1])
+        new_offsets = offsets[first:last+2] - offsets[first]
+        data = np.array(table.data[rows][:,table.wanted])
+    else:
+        lengths = offsets[selected+1] - offsets[selected]
+        rows = np.concatenate([np.arange(offsets[k],offsets[k+1]) \
+                                   for k in selected])
+        new_offsets = np.concatenate(([0],np.cumsum(lengths)))
+        data = table.data[np.ix_(rows,table.wanted)]
+    columns = {name : decode_column(name,arrays,rows) \
+                   for name,arrays in table.columns.items()}
+    compact = etd.compact_schema(table.projected)[1]
+    return etd.Snapshots(columns,data,table.iterations[selected],
+                         new_offsets.astype(np.int64),compact)
+
+def extract_data(directory,duplicates=DEFAULT_DUPLICATES,components=None,
+                 fields=None,iterations=None,times=None,levels=None):
+    """
+    Reads the table in directory into a Snapshots store. duplicates,
+    components, fields, iterations and times are as in
+    etd.extract_data. levels is a list of the refinement levels we
+    want, or None for all of them. Raises a ValueError if no snapshot
+    is in the windows.
+    """
+    if duplicates == DEFAULT_DUPLICATES:
+        duplicates = etd.DUPLICATE_RULE
+    table = open_table(directory,duplicates,components,fields)
+    selected = etd.select_window(table.iterations,table.times,
+                                 iterations,times)
+    if len(selected) == 0:
+        raise ValueError("{} has no snapshots in the window.".format(directory))
+    store = read_table(table,selected)
+    if levels is not None:
+        store = store.select_levels(levels)
+    return etd.deduplicate(store,duplicates)
+
+def iterate_snapshots(directory,duplicates=DEFAULT_DUPLICATES,
+                      components=None,fields=None):
+    """
+    A generator version of extract_data. Reads the table one snapshot
+    at a time and yields each snapshot in turn as a Snapshot. The
+    manifest is read and the columns mapped only once.
+    """
+    if duplicates == DEFAULT_DUPLICATES:
+        duplicates = etd.DUPLICATE_RULE
+    table = open_table(directory,duplicates,components,fields)
+    for k in range(len(table.iterations)):
+        store = read_table(table,np.array([k]))
+        yield etd.deduplicate(store,duplicates)[0]
+
+def extract_snapshot(directory,index,duplicates=DEFAULT_DUPLICATES,
+                     components=None,fields=None):
+    """
+    Returns only the index-th snapshot in the table (the snapshot
+    index, not the iteration number).
+    """
+    if duplicates == DEFAULT_DUPLICATES:
+        duplicates = etd.DUPLICATE_RULE
+    table = open_table(directory,duplicates,components,fields)
+    if index < 0:
+        index += len(table.iterations)
+    if not 0 <= index < len(table.iterations):
+        raise IndexError("{} has no snapshot {}".format(directory,index))
+    store = read_table(table,np.array([index]))
+    return etd.deduplicate(store,duplicates)[0]
+
+
+if __name__=="__main__":
+    raise ImportWarning(WARNING_MESSAGE)
@@ -0,0 +1,208 @@
+"""
+compressed_files.py
+
+Finished simulations are often archived as compressed ASCII files,
+like
+
+/path/to/admbase::metric.x.asc.gz
+
+to save disk quota. This little library lets the rest of the toolbox
+read them exactly as if they were plain text, without unpacking them
+to disk first.
+----------------------------------------------------------------------
+
+gzip (.gz), bzip2 (.bz2) and xz (.xz) are supported. The format is
+chosen by the extension of the file, or, if the extension doesn't say,
+by the magic bytes at the start of it. xz needs the lzma module, which
+is only in the standard library for python 3.
+
+If we ask for a plain file that doesn't exist, but a compressed
+version of it does, we use the compressed version. So code that looks
+for admbase::metric.x.asc finds admbase::metric.x.asc.gz.
+
+read_chunks decompresses on a separate thread, a few chunks ahead of
+whoever is reading. zlib, bz2 and lzma release the GIL while they
+work, so parsing one chunk overlaps with decompressing the next.
+
+Offsets are always offsets into the decompressed text. Compressed
+files can't be seeked, so reading from the middle of one means
+decompressing everything before it.
+"""
+
+# Imports
+# ----------------------------------------------------------------------
+import os # File system tools
+import gzip # For .gz files
+import bz2 # For .bz2 files
+import threading # To decompress in the background
+try:
+    import lzma # For .xz files
+except ImportError:
+    lzma = None
+try:
+    from queue import Queue,Full
+except ImportError:
+    from Queue import Queue,Full
+# ----------------------------------------------------------------------
+
+# Global constants
+# ----------------------------------------------------------------------
+GZIP = 'gzip'
+BZIP2 = 'bz2'
+XZ = 'xz'
+# Extension and magic bytes of each format
+SUFFIXES = {GZIP : '.gz', BZIP2 : '.bz2', XZ : '.xz'}
+MAGIC_BYTES = {GZIP : b'\x1f\x8b', BZIP2 : b'BZh', XZ : b'\xfd7zXZ\x00'}
+READ_CHUNK_SIZE = 1<<22
+# How many decompressed chunks the background thread may keep ready
+READ_AHEAD = 4
+# How often (in seconds) a blocked background thread checks whether
+# the reader has gone away
+POLL_INTERVAL = 0.1
+WARNING_MESSAGE = "This is a library. You are only supposed to import it!"
+# ----------------------------------------------------------------------
+
+def find_file(filename):
+    """
+    Returns filename if it exists. Otherwise returns the first
+    compressed version of it (filename.gz, filename.bz2 or
+    filename.xz) that exists. If none of them do, returns filename.
+    """
+    if os.path.exists(filename):
+        return filename
+    for kind in [GZIP,BZIP2,XZ]:
+        if os.path.exists(filename + SUFFIXES[kind]):
+            return filename + SUFFIXES[kind]
+    return filename
+
+def compression_of(filename):
+    """
+    Returns the compression format of filename (GZIP, BZIP2 or XZ), or
+    None if it is a plain file.
+    """
+    for kind,suffix in SUFFIXES.items():
+        if filename.endswith(suffix):
+            return kind
+    with open(filename,'rb') as f:
+        start = f.read(max(len(magic) for magic in MAGIC_BYTES.values()))
+    for kind,magic in MAGIC_BYTES.items():
+        if start.startswith(magic):
+            return kind
+    return None
+
+def is_compressed(filename):
+    "True if filename is compressed."
+    return compression_of(find_file(filename)) is not None
+
+def open_file(filename):
+    """
+    Opens filename for reading in binary mode, decompressing it on the
+    fly if it is compressed. The result can be used like any binary
+    file: read, iterate over lines, use in a with statement.
+    """
+    filename = find_file(filename)
+    kind = compression_of(filename)
+    if kind == GZIP:
+        return gzip.open(filename,'rb')
+    if kind == BZIP2:
+        return bz2.BZ2File(filename,'rb')
+    if kind == XZ:
+        if lzma is None:
+            raise IOError("Reading {} needs the lzma module.".format(filename))
+        return lzma.open(filename,'rb')
+    return open(filename,'rb')
+
+def put_unless_done(queue,item,done):
+    """
+    Puts item on queue, waiting as long as it takes, unless done is
+    set first. Returns True if item was put on the queue.
+    """
+    while not done.is_set():
+        try:
+            queue.put(item,timeout=POLL_INTERVAL)
+            return True
+        except Full:
+            pass
+    return False
+
+def decompress_ahead(f,chunk_size,queue,done):
+    """
+    Reads f in chunks and puts them on queue until f runs out, then
+    puts an empty chunk. If reading fails, the exception goes on the
+    queue instead. Stops early if done is set.
+
+    This is what the background thread in read_chunks runs.
+    """
+    try:
+        while True:
+            chunk = f.read(chunk_size)
+            if not put_unless_done(queue,chunk,done) or not chunk:
+                return
+    except Exception as error:
+        put_unless_done(queue,error,done)
+
+def read_chunks(filename,chunk_size=READ_CHUNK_SIZE,start=0,stop=None):
+    """
+    Yields the bytes of filename from byte start up to byte stop (or
+    the end of the file) in chunks of about chunk_size. Compressed
+    files are decompressed on a background thread, READ_AHEAD chunks
+    ahead of the reader. Plain files are simply read.
+    """
+    f = open_file(filename)
+    if compression_of(find_file(filename)) is None:
+        try:
+            f.seek(start)
+            position = start
+            while stop is None or position < stop:
+                size = chunk_size if stop is None \
+                    else min(chunk_size,stop - position)
+                chunk = f.read(size)
+                if not chunk:
+                    return
+                position += len(chunk)
+                yield chunk
+        finally:
+            f.close()
+        return
+    queue = Queue(READ_AHEAD)
+    done = threading.Event()
+    thread = threading.Thread(target=decompress_ahead,
+                              args=(f,chunk_size,queue,done))
+    thread.daemon = True
+    thread.start()
+    try:
+        position = 0
+        while stop is None or position < stop:
+            chunk = queue.get()
+            if isinstance(chunk,Exception):
+                raise chunk
+            if not chunk:
+                return
+            first = max(start - position,0)
+            last = len(chunk) if stop is None \
+                else min(stop - position,len(chunk))
+            position += len(chunk)
+            if last > first:
+                yield chunk[first:last]
+    finally:
+        done.set()
+        thread.join()
+        f.close()
+
+def iterate_lines(filename,chunk_size=READ_CHUNK_SIZE):
+    """
+    Yields the lines of filename, with their line endings, using
+    read_chunks.
+    """
+    rest = b''
+    for chunk in read_chunks(filename,chunk_size):
+        lines = (rest + chunk).split(b'\n')
+        rest = lines.pop()
+        for line in lines:
+            yield line + b'\n'
+    if rest:
+        yield rest
+
+
+if __name__=="__main__":
+    raise ImportWarning(WARNING_MESSAGE)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python2
+
+"""
+convert_simulation.py
+
+Converts the ASCII output of finished simulations into compact
+columnar archives (see columnar_archive.py), so later analyses don't
+have to parse the text again. A call might look like:
+
+python2 convert_simulation.py /path/to/simulation1 /path/to/simulation2
+
+Each simulation is a directory made by simfactory, with one
+output-NNNN directory per restart. Every CarpetIOASCII file in it gets
+a table in
+
+/path/to/simulation1.archive/
+
+with all of its restarts stitched together. Files that aren't
+CarpetIOASCII output (like the scalar reductions in *.norm2.asc) are
+skipped. The files are converted in parallel (see
+parallel_loading.py). To choose the number of worker processes, use
+--workers:
+
+python2 convert_simulation.py --workers=4 /path/to/simulation1
+
+Running the same command again only converts the files that changed
+or weren't converted yet, so an interrupted conversion can simply be
+started again.
+"""
+
+# Imports
+# ----------------------------------------------------------------------
+import os # File system tools
+import sys # For command line arguments
+import extract_tensor_data as etd # To read the schema of each file
+import simfactory_interface as interface # To walk the simulation
+import compressed_files # For archived output
+import columnar_archive # To write the tables
+import parallel_loading # To convert the files in parallel
+# ----------------------------------------------------------------------
+
+# Global constants
+# ----------------------------------------------------------------------
+WORKERS_FLAG = '--workers='
+ASCII_SUFFIX = interface.ASCII_POSTFACTOR
+# ----------------------------------------------------------------------
+
+def ascii_name(file_name):
+    """
+    Returns the name of the ASCII file file_name is, with any
+    compression suffix removed, or None if it isn't an ASCII file.
+    """
+    for suffix in compressed_files.SUFFIXES.values():
+        if file_name.endswith(suffix):
+            file_name = file_name[:-len(suffix)]
+    return file_name if file_name.endswith(ASCII_SUFFIX) else None
+
+def get_output_files(root_dir_name):
+    """
+    Returns the names of the ASCII output files the restarts of the
+    simulation in root_dir_name have between them, sorted.
+    """
+    names = set()
+    for restart_number in interface.get_restart_numbers(root_dir_name):
+        directory = interface.get_data_directory(root_dir_name,restart_number)
+        for file_name in os.listdir(directory):
+            name = ascii_name(file_name)
+            if name is not None and os.path.isfile(directory + file_name):
+                names.add(name)
+    return sorted(names)
+
+def is_carpet_output(path):
+    """
+    True if path is CarpetIOASCII output that extract_tensor_data can
+    read.
+    """
+    try:
+        return len(etd.read_schema(path).data_names) > 0
+    except (ValueError,IndexError):
+        return False
+
+def convert_file(arguments):
+    """
+    Takes a tuple (root_dir_name,file_name) and writes the table for
+    file_name in the archive of the simulation, unless it's already
+    current. Returns (file_name,status), where status is 'converted',
+    'current' or 'skipped'.
+
+    This is what the workers in convert run.
+    """
+    root_dir_name,file_name = arguments
+    paths = interface.get_restart_file_paths(root_dir_name,file_name)
+    if not paths or not is_carpet_output(paths[0]):
+        return file_name,'skipped'
+    directory = os.path.join(columnar_archive.archive_directory(root_dir_name),
+                             columnar_archive.table_name(file_name))
+    if columnar_archive.is_current(directory,paths):
+        return file_name,'current'
+    # The archive keeps every row, like the cache in ascii_cache.py
+    timeline = interface.Timeline(root_dir_name,file_name,duplicates=None,
+                                  use_cache=False)
+    columnar_archive.write_table(directory,timeline.load(use_cache=False),
+                                 paths)
+    return file_name,'converted'
+
+def convert(root_dir_names,workers=parallel_loading.LOAD_WORKERS):
+    """
+    Converts every ASCII output file of every simulation in
+    root_dir_names. The files are converted by up to workers
+    processes, as many as fit in memory.
+    """
+    jobs = []
+    job_memory = []
+    for root_dir_name in root_dir_names:
+        for file_name in get_output_files(root_dir_name):
+            paths = interface.get_restart_file_paths(root_dir_name,file_name)
+            jobs.append((root_dir_name,file_name))
+            job_memory.append(sum([parallel_loading.estimated_memory(path) \
+                                       for path in paths]))
+    results = parallel_loading.load_all(convert_file,jobs,workers,job_memory)
+    for job,result in zip(jobs,results):
+        print "{} {} {}".format(job[0],result[0],result[1])
+    return
+
+if __name__ == "__main__":
+    arguments = sys.argv[1:]
+    workers = parallel_loading.LOAD_WORKERS
+    if arguments and arguments[0].startswith(WORKERS_FLAG):
+        workers = int(arguments[0][len(WORKERS_FLAG):])
+        arguments = arguments[1:]
+    convert(arguments,workers)
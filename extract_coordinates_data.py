@@ -7,12 +7,20 @@ When the Coordinates thorn is active, the coordinates information in a
 data file is incorrect and one must use the Grid::coordinates file to
 map to the physical configuration space. This little library defines
 the functions that do this.
+
+The mapping usually doesn't change during a simulation, so
+make_coordinate_maps stores each distinct map once. Every snapshot
+whose map matches one we've already seen points at the same AxisMap
+objects.
 """
 
 # Imports
 # ----------------------------------------------------------------------
+import hashlib # To recognize maps we've already seen
 import numpy as np # For arrays
 from numpy.linalg import norm # for grid spacing
+import extract_tensor_data as etd # For parsing and caching the file
+import simfactory_interface as interface # To read every restart
 # ----------------------------------------------------------------------
 
 # Global constants
@@ -23,42 +31,187 @@ Z_AXIS = 2
 WARNING_MESSAGE = "This is a library. You are only supposed to import it!"
 # ----------------------------------------------------------------------
 
-def make_coordinate_maps(filename):
+class AxisMap(object):
+    """
+    Maps the grid indices along one axis to physical coordinates. The
+    coordinates are kept in a dense array, one entry per index between
+    the smallest and largest index, so mapping a whole array of
+    indices is a single gather:
+
+    positions = axis_map[snapshot.column('ix')]
+
+    A single index works too. An index the map doesn't know raises a
+    KeyError.
+
+    Otherwise an AxisMap behaves like the dictionary {ix:x} it
+    replaces, with keys, values, items, len and in.
+    """
+    def __init__(self,indices,positions):
+        indices = np.asarray(indices,dtype=np.int64)
+        positions = np.asarray(positions,dtype=float)
+        self.first = int(indices.min()) if len(indices) > 0 else 0
+        size = int(indices.max()) - self.first + 1 if len(indices) > 0 else 0
+        self.positions = np.full(size,np.nan)
+        self.known = np.zeros(size,dtype=bool)
+        # Like a dictionary, the last of duplicated indices wins
+        self.positions[indices - self.first] = positions
+        self.known[indices - self.first] = True
+        # Filled in by spacing the first time we need it
+        self.spacing_cache = None
+
+    def __len__(self):
+        return int(self.known.sum())
+
+    def __getitem__(self,index):
+        offsets = np.asarray(index) - self.first
+        inside = (0 <= offsets) & (offsets < len(self.known))
+        if not np.all(inside) or not np.all(self.known[offsets]):
+            raise KeyError(index)
+        return self.positions[offsets]
+
+    def __contains__(self,index):
+        offset = index - self.first
+        return 0 <= offset < len(self.known) and bool(self.known[offset])
+
+    def __iter__(self):
+        return iter(self.keys().tolist())
+
+    def keys(self):
+        "Returns the grid indices in the map, sorted."
+        return np.flatnonzero(self.known) + self.first
+
+    def values(self):
+        "Returns the coordinates of keys()."
+        return self.positions[self.known]
+
+    def items(self):
+        "Returns a list of (index,coordinate) pairs, like dict.items."
+        return list(zip(self.keys().tolist(),self.values().tolist()))
+
+    def to_dict(self):
+        "Returns the map as a dictionary {index:coordinate}."
+        return dict(self.items())
+
+    def spacing(self):
+        """
+        Returns (positions,spacings), the distinct coordinates in the
+        map, sorted, and the local grid spacing at each. The spacing
+        is the centered difference in the interior and the one-sided
+        difference at the edges. (An isolated point has spacing
+        nan.) Computed once, then cached with the map.
+        """
+        if self.spacing_cache is None:
+            positions = np.unique(self.values())
+            spacings = np.full(len(positions),np.nan)
+            if len(positions) > 1:
+                spacings[1:-1] = (positions[2:] - positions[:-2])/2.0
+                spacings[0] = positions[1] - positions[0]
+                spacings[-1] = positions[-1] - positions[-2]
+            self.spacing_cache = (positions,spacings)
+        return self.spacing_cache
+
+    def spacing_at(self,index):
+        """
+        Returns the local grid spacing at the grid index (or array of
+        indices) index. See spacing.
+        """
+        positions,spacings = self.spacing()
+        return spacings[np.searchsorted(positions,self[index])]
+
+    def signature(self):
+        """
+        Returns a short key that is the same for maps with the same
+        indices and coordinates.
+        """
+        digest = hashlib.sha1(self.positions.tobytes())
+        digest.update(self.known.tobytes())
+        return (self.first,digest.hexdigest())
+
+    def same_as(self,other):
+        "True if other maps the same indices to the same coordinates."
+        return self.first == other.first \
+            and np.array_equal(self.known,other.known) \
+            and np.array_equal(self.positions[self.known],
+                               other.positions[other.known])
+
+
+def share_map(axis_map,distinct):
+    """
+    Returns the AxisMap in the dictionary distinct that is the same as
+    axis_map, or adds axis_map to distinct and returns it if there
+    isn't one.
+    """
+    key = axis_map.signature()
+    if key in distinct and distinct[key].same_as(axis_map):
+        return distinct[key]
+    distinct[key] = axis_map
+    return axis_map
+
+def maps_of_store(data,distinct=None):
+    """
+    Makes the coordinate maps (see make_coordinate_maps) of every
+    snapshot in the Snapshots store data.
+
+    Each distinct map is stored once. distinct is a dictionary of the
+    maps we've seen so far (see share_map). Pass the same dictionary
+    to several calls to share maps between them.
+    """
+    if distinct is None:
+        distinct = {}
+    snapshots_list = []
+    previous = None
+    for snapshot in data:
+        # The data columns are [true_x,true_y,true_z,r]
+        true_positions = snapshot.data()
+        indices = [snapshot.column(etd.INDEX_COLUMNS[axis]) \
+                       for axis in [X_AXIS,Y_AXIS,Z_AXIS]]
+        # Most of the time nothing changed since the last snapshot,
+        # and we don't have to build the maps at all.
+        if previous is not None \
+                and np.array_equal(true_positions[:,:3],previous[0]) \
+                and all(np.array_equal(new,old) \
+                            for new,old in zip(indices,previous[1])):
+            snapshots_list.append(snapshots_list[-1])
+            continue
+        maps = [share_map(AxisMap(indices[axis],true_positions[:,axis]),
+                          distinct) \
+                    for axis in [X_AXIS,Y_AXIS,Z_AXIS]]
+        snapshots_list.append(maps)
+        previous = (true_positions[:,:3],indices)
+    return snapshots_list
+
+def make_coordinate_maps(filename,iterations=None,times=None,distinct=None):
     """
     Extracts the data from a file and makes a list of snapshots,
     {snapshot1, snapshot2, snapshot3,...}
     where each snapshot takes place at a different iteration.
-    Each snapshot is a list containing three dictionaries:
+    Each snapshot is a list containing three AxisMaps:
     [{ix:x}, {iy:y}, {iz:z}]
     which map grid coordinates to physical coordinates.
+
+    Snapshots with the same maps share them, so don't change a map in
+    place. distinct is as in maps_of_store.
+
+    The parsed file is cached in a binary sidecar by
+    etd.extract_data, so only the first call parses the text.
+
+    iterations and times pick out the snapshots we want, as in
+    etd.extract_data.
     """
-    data = np.loadtxt(filename)
-    snapshots = {int(line[0]) : [{},{},{}] for line in data}
-    for row in data:
-        # Convenience variable definitions
-        time_step = int(row[0])
-        tl = int(row[1])
-        rl = int(row[2])
-        c = int(row[3])
-        ml = int(row[4])
-        ix = int(row[5])
-        iy = int(row[6])
-        iz = int(row[7])
-        t = row[8]
-        x = row[9]
-        y = row[10]
-        z = row[11]
-        true_x = row[12]
-        true_y = row[13]
-        true_z = row[14]
-        r = row[15]
-        snapshots[row[0]][0][ix]=true_x
-        snapshots[row[0]][1][iy]=true_y
-        snapshots[row[0]][2][iz]=true_z
-    keys = snapshots.keys()
-    keys.sort()
-    snapshots_list = [snapshots[keys[i]] for i in range(len(keys))]
-    return snapshots_list
+    data = etd.extract_data(filename,iterations=iterations,times=times)
+    return maps_of_store(data,distinct)
+
+def make_coordinate_maps_of_simulation(root_dir_name,iterations=None,
+                                       times=None,
+                                       file_name=interface.COORDS_XPROJ):
+    """
+    Like make_coordinate_maps, but for every restart of the simulation
+    in root_dir_name, stitched together (see
+    simfactory_interface.Timeline). A map that is the same in several
+    restarts is stored once.
+    """
+    timeline = interface.Timeline(root_dir_name,file_name)
+    return maps_of_store(timeline.load(iterations,times))
 
 def difference_stensil(my_list,my_index):
     """
@@ -72,8 +225,16 @@ def difference_stensil(my_list,my_index):
     elif my_index == len(my_list)-1:
         difference = norm(my_list[my_index] - my_list[my_index-1])
     else: # centered difference
-        differences = norm(my_list[my_index+1] - my_list[my_index-1])/2.0
-    return differences
+        difference = norm(my_list[my_index+1] - my_list[my_index-1])/2.0
+    return difference
+
+def lattice_spacings(coordinate_maps,axis=X_AXIS):
+    """
+    The array version of get_lattice_spacing. Returns a list with one
+    entry (positions,spacings) per snapshot, as in AxisMap.spacing.
+    Snapshots that share a map share the arrays too.
+    """
+    return [maps[axis].spacing() for maps in coordinate_maps]
 
 def get_lattice_spacing(coordinate_maps,axis=X_AXIS):
     """
@@ -87,15 +248,20 @@ def get_lattice_spacing(coordinate_maps,axis=X_AXIS):
     spacing, along that direction, depending on the choice of axis.
 
     This function is not guaranteed to work if the grid is not Cartesian.
+
+    The spacings come from lattice_spacings. For arrays instead of
+    dictionaries, use that.
     """
-    
     spacing_snapshots = []
-    for i in range(len(coordinate_maps)):
-        positions = list(set(coordinate_maps[i][axis].values()))
-        positions.sort()
-        spacing_map = {positions[i] : difference_stensil(positions,i)\
-                           for i in range(len(positions))}
-        spacing_snapshots.append(spacing_map)
+    # Snapshots that share a map share the dictionary too
+    spacing_maps = {}
+    for maps in coordinate_maps:
+        axis_map = maps[axis]
+        if id(axis_map) not in spacing_maps:
+            positions,spacings = axis_map.spacing()
+            spacing_maps[id(axis_map)] = dict(zip(positions.tolist(),
+                                                  spacings.tolist()))
+        spacing_snapshots.append(spacing_maps[id(axis_map)])
     return spacing_snapshots
 
 def get_all_coord_data(filename,axis=X_AXIS):
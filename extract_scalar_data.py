@@ -69,13 +69,16 @@ def scalar_at_position_of_time(position,data):
     output should be a projection onto an axis or or a one-dimensional
     line. So these will naturally be in order.
     """
+    if etd.is_store(data):
+        times,scalars = etd.element_at_position_of_time(0,0,position,data)
+        return times,scalars
     times = []
     scalars = []
     for iteration in data:
         times.append(iteration[0][4])
         scalars.append(iteration[position][-1])
     times = np.array(times)
-    scalars = np.array(elements)
+    scalars = np.array(scalars)
     return times,scalars
 
 def scalar_at_position_of_time_from_file(position,filename):
@@ -95,6 +98,8 @@ def scalar_of_position_at_time(coord,time,data):
 
     coord gives the coordinate to examine. 0=x,1=y,2=z
     """
+    if etd.is_store(data):
+        return etd.element_of_position_at_time(0,0,coord,time,data)
     positions = []
     scalars = []
     for line in data[time]:
@@ -107,9 +112,11 @@ def scalar_of_position_at_time(coord,time,data):
 def scalar_of_position_at_time_from_file(coord,time,filename):
     """
     Same as scalar of position at time, but extracts information from a file
+
+    Only the snapshot we need is parsed.
     """
-    data = extract_data(filename)
-    return scalar_of_position_at_time(coord,time,data)
+    snapshot = etd.extract_snapshot(filename,time)
+    return etd.element_of_position_at_snapshot(0,0,coord,snapshot)
 
 
 if __name__=="__main__":
@@ -34,26 +34,1073 @@ c = component. The index of the processor the domain is on.
 ml = multigrid level. Unused. Always zero.
 
 ix,iy, and iz are the indexes of the lattice points on the grid. Data
-is for a 3x3 symmetric tensor
+is usually for a 3x3 symmetric tensor
 
 [Txx, Txy, Txz, Tyy, Tyz, Tzz]
 
 where T is whatever tensor we're interested in. Since the tensor is
 symmetric, this is all the information.
+
+The same code reads scalars, vectors and whole groups of variables. The
+'# column format' and '# data columns' lines in the header of the file
+say which column is which, and read_schema turns them into a Schema
+that names every data column.
+
+Building all of those little lists and arrays is very expensive for
+large files. So extract_data actually returns a Snapshots object,
+which stores each column of the file as one contiguous numpy array and
+keeps track of which rows belong to which iteration. A Snapshots
+object can be indexed exactly like the list of snapshots above, but
+the rows are only built when you ask for them. The element_* methods
+below slice the columns directly and never build rows at all.
 """
 # ----------------------------------------------------------------------
 
 
 # Imports
 # ----------------------------------------------------------------------
+import os # To watch files grow
 import numpy as np # For arrays
 from numpy.linalg import norm
+from itertools import islice # To stream snapshots
+from collections import namedtuple
+import multiprocessing # For parsing big files in parallel
+import re # To strip comments
+import ascii_cache # Binary sidecars for parsed files
+import compressed_files # For .gz, .bz2 and .xz files
+import carpet_hdf5 # For CarpetIOHDF5 output
+import columnar_archive # For archived simulations
 # ----------------------------------------------------------------------
 
 
 # Global variables
 # ----------------------------------------------------------------------
 WARNING_MESSAGE = "This is a library. You are only supposed to import it!"
+# Mark false to always parse files from scratch
+USE_CACHE = True
+# The kind of sidecar data extract_data keeps (see ascii_cache.py)
+CACHE_KIND = 'snapshots'
+# The metadata columns at the start of every row of a Cactus ASCII
+# file, in order. Everything after them is data.
+METADATA_COLUMNS = ['it','tl','rl','c','ml','ix','iy','iz','time','x','y','z']
+INTEGER_COLUMNS = ['it','tl','rl','c','ml','ix','iy','iz']
+NUM_METADATA_COLUMNS = len(METADATA_COLUMNS)
+# Names of the columns that hold the grid indices and the positions,
+# ordered by coordinate. 0=x,1=y,2=z
+INDEX_COLUMNS = ['ix','iy','iz']
+POSITION_COLUMNS = ['x','y','z']
+# Header line that starts each component block of a snapshot
+ITERATION_HEADER = b'# iteration'
+TIME_HEADER = b'# time'
+# The kind of sidecar data that holds the byte offset of each iteration
+OFFSET_INDEX_KIND = 'offsets'
+# How many bytes to read at a time when scanning for headers
+SCAN_CHUNK_SIZE = 1 << 22
+# Comments in a Cactus ASCII file. '#' never shows up in data, so we
+# don't need to anchor this to the start of a line (which is slow).
+COMMENT_LINE = re.compile(b'#[^\n]*')
+# A blank line, once the comments are gone, found by the newline
+# before it
+BLANK_LINE = re.compile(b'\n[ \t\r]*(?=\n)')
+# Number of processes extract_data parses a file with. 1 means no pool.
+PARSE_WORKERS = 1
+# Files are parsed in chunks of about this many bytes, cut at
+# iteration boundaries. Each worker gets at least CHUNKS_PER_WORKER
+# chunks so the load stays balanced.
+PARSE_CHUNK_SIZE = 1 << 26
+CHUNKS_PER_WORKER = 4
+# Ghost points and points where Carpet components overlap show up more
+# than once in a snapshot. A point is identified by these columns. The
+# past time levels of a point aren't copies of it, so 'tl' is part of
+# the key.
+DUPLICATE_KEY_COLUMNS = ['tl','rl','ix','iy','iz']
+# Which copy of a duplicated point to keep:
+# 'first' keeps the first copy in the file,
+# 'last' keeps the last copy in the file,
+# 'lowest_component' keeps the copy with the smallest c,
+# 'highest_component' keeps the copy with the largest c.
+# None keeps every row.
+DUPLICATE_RULES = ['first','last','lowest_component','highest_component']
+DUPLICATE_RULE = 'first'
+# Metadata columns every store keeps, even when the caller only asks
+# for a few columns
+REQUIRED_FIELDS = ['it','tl','time']
+# Use a dense lookup table to find duplicates if it would have at most
+# this many entries per row. Otherwise sort.
+DENSE_KEY_FACTOR = 8
+# Maps (i,j) to the index of that element in [Txx,Txy,Txz,Tyy,Tyz,Tzz]
+SYMMETRIC_TENSOR_INDEX = np.array([[0,1,2],
+                                   [1,3,4],
+                                   [2,4,5]])
+# The (i,j) of each element of [Txx,Txy,Txz,Tyy,Tyz,Tzz]
+SYMMETRIC_TENSOR_PAIRS = [(0,0),(0,1),(0,2),(1,1),(1,2),(2,2)]
+# Times that agree to 10 decimal places are the same time
+TIME_TOLERANCE = 5E-11
+# The reductions segment_reductions knows
+REDUCTIONS = ['L1','L2','Linf','min','max','mean']
+# The reduction that gives each order of norm
+ORDER_REDUCTIONS = {1 : 'L1', 2 : 'L2', np.inf : 'Linf'}
+# Pass as levels to extract_data for the composite of the finest data
+# available at every point (see Snapshots.finest)
+FINEST = 'finest'
+# The metadata columns the composite needs
+FINEST_FIELDS = ['tl','rl','c'] + POSITION_COLUMNS
+# The time level that holds the data at the time of the snapshot. The
+# others are the past time levels.
+CURRENT_TIME_LEVEL = 0
+# The fields get_lattice_spacing needs to tell the levels apart
+SPACING_FIELDS = ['rl'] + INDEX_COLUMNS + POSITION_COLUMNS
+# Header lines that describe the columns of a file
+COLUMN_FORMAT_HEADER = b'# column format:'
+DATA_COLUMNS_HEADER = b'# data columns:'
+# In the column format, this marks the first data column
+DATA_MARKER = 'data'
+# The kinds of variable a file can hold. We tell them apart by the
+# names of the data columns: a common prefix (like g or beta)
+# followed by these suffixes.
+SCALAR = 'scalar'
+VECTOR = 'vector'
+SYMMETRIC_TENSOR = 'symmetric_tensor'
+GROUP = 'group'
+VECTOR_SUFFIXES = ['x','y','z']
+SYMMETRIC_TENSOR_SUFFIXES = ['xx','xy','xz','yy','yz','zz']
+# Name for a tensor in a file with no '# data columns' line
+UNNAMED_TENSOR = 'T'
+# A data structure describing the column layout of a file.
+# metadata maps each name in METADATA_COLUMNS to its column in the
+# file. data_columns lists the column in the file of each data
+# column, and data_names their names. kind is one of SCALAR, VECTOR,
+# SYMMETRIC_TENSOR or GROUP.
+Schema = namedtuple('Schema',['metadata','data_columns','data_names','kind'])
+# ----------------------------------------------------------------------
+
+
+# The column layout
+# ----------------------------------------------------------------------
+def to_str(name):
+    "Takes a name read from a file in binary mode and makes it a str."
+    return name if isinstance(name,str) else name.decode('ascii')
+
+def classify_data(data_names):
+    """
+    Takes the names of the data columns of a file and decides whether
+    they are a SCALAR, a VECTOR, a SYMMETRIC_TENSOR or a GROUP of
+    unrelated variables.
+    """
+    if len(data_names) == 1:
+        return SCALAR
+    for kind,suffixes in [(VECTOR,VECTOR_SUFFIXES),
+                          (SYMMETRIC_TENSOR,SYMMETRIC_TENSOR_SUFFIXES)]:
+        n = len(suffixes[0])
+        if [name[-n:] for name in data_names] == suffixes \
+                and len(set(name[:-n] for name in data_names)) == 1:
+            return kind
+    return GROUP
+
+def make_schema(column_format=None,data_columns=None,num_columns=None):
+    """
+    Builds a Schema.
+
+    column_format is the list of tokens after '# column format:', like
+    ['1:it','2:tl',...,'13:data'] (the numbers are optional).
+    data_columns is the list of tokens after '# data columns:', like
+    ['13:gxx','14:gxy',...]. num_columns is the number of columns in a
+    data row. Whatever is missing is filled in with the standard
+    Cactus layout.
+    """
+    if column_format:
+        column_format = [to_str(token) for token in column_format]
+        names = [token.split(':')[-1] for token in column_format]
+        positions = [int(token.split(':')[0]) - 1 if ':' in token else k \
+                         for k,token in enumerate(column_format)]
+    else:
+        names = METADATA_COLUMNS + [DATA_MARKER]
+        positions = list(range(len(names)))
+    metadata = {names[k] : positions[k] for k in range(len(names)) \
+                    if names[k] != DATA_MARKER}
+    missing = [name for name in METADATA_COLUMNS if name not in metadata]
+    if missing:
+        raise ValueError("Column format is missing {}".format(missing))
+    data_start = positions[names.index(DATA_MARKER)] \
+        if DATA_MARKER in names else max(positions) + 1
+    if data_columns:
+        data_columns = [to_str(token) for token in data_columns]
+        data_names = [token.split(':')[-1] for token in data_columns]
+        columns = [int(token.split(':')[0]) - 1 if ':' in token \
+                       else data_start + k \
+                       for k,token in enumerate(data_columns)]
+    else:
+        num_data = num_columns - data_start if num_columns else 1
+        columns = list(range(data_start,data_start + num_data))
+        if num_data == 1:
+            data_names = [DATA_MARKER]
+        elif num_data == len(SYMMETRIC_TENSOR_SUFFIXES):
+            # Without names, assume a symmetric tensor, as we always have
+            data_names = [UNNAMED_TENSOR + suffix \
+                              for suffix in SYMMETRIC_TENSOR_SUFFIXES]
+        else:
+            data_names = [DATA_MARKER + str(k) for k in range(num_data)]
+    return Schema(metadata,columns,data_names,classify_data(data_names))
+
+def component_name(schema,component):
+    """
+    Takes a component of the variable described by schema and returns
+    the name of its data column. A component can be a name (like
+    'gxy'), an index i or a pair (i,j), as in data_index.
+    """
+    if isinstance(component,tuple):
+        return schema.data_names[data_index(schema,*component)]
+    if isinstance(component,(int,np.integer)):
+        return schema.data_names[data_index(schema,component)]
+    if component not in schema.data_names:
+        raise ValueError("There is no data column {}".format(component))
+    return component
+
+def project_schema(schema,components=None,fields=None,
+                   duplicates=DUPLICATE_RULE):
+    """
+    Restricts schema to some of its columns.
+
+    components is a list of the data components we want (see
+    component_name) and fields is a list of the names in
+    METADATA_COLUMNS we want. None means all of them. The
+    REQUIRED_FIELDS, and the fields we need to remove duplicate points
+    by the rule duplicates, are always kept.
+
+    The kind of the variable doesn't change, so (i,j) still means the
+    same thing in the projected schema.
+    """
+    if components is None and fields is None:
+        return schema
+    if components is None:
+        data_names = list(schema.data_names)
+    else:
+        data_names = []
+        for component in components:
+            name = component_name(schema,component)
+            if name not in data_names:
+                data_names.append(name)
+    keep = set(REQUIRED_FIELDS)
+    keep.update(METADATA_COLUMNS if fields is None else fields)
+    if duplicates is not None:
+        keep.update(DUPLICATE_KEY_COLUMNS)
+        if duplicates.endswith('component'):
+            keep.add('c')
+    metadata = {name : schema.metadata[name] for name in METADATA_COLUMNS \
+                    if name in keep}
+    data_columns = [schema.data_columns[schema.data_names.index(name)] \
+                        for name in data_names]
+    return Schema(metadata,data_columns,data_names,schema.kind)
+
+def compact_schema(schema):
+    """
+    Takes a schema whose columns may skip some of the columns in the
+    file and returns (usecols,compact). usecols is the sorted list of
+    columns of the file the schema uses. compact is the same schema,
+    but for a table that holds only the columns in usecols.
+    """
+    usecols = sorted(set(schema.metadata.values()) | set(schema.data_columns))
+    position = {column : k for k,column in enumerate(usecols)}
+    metadata = {name : position[column] \
+                    for name,column in schema.metadata.items()}
+    data_columns = [position[column] for column in schema.data_columns]
+    return usecols,Schema(metadata,data_columns,list(schema.data_names),
+                          schema.kind)
+
+def prepare_schema(filename,components=None,fields=None,
+                   duplicates=DUPLICATE_RULE):
+    """
+    Reads the schema of filename and restricts it to the columns we
+    want (see project_schema). Returns (usecols,schema), ready to hand
+    to the parse_* functions and make_snapshots. usecols is None if we
+    want every column.
+    """
+    schema = read_schema(filename)
+    projected = project_schema(schema,components,fields,duplicates)
+    if projected is schema:
+        return None,schema
+    return compact_schema(projected)
+
+def read_schema(filename):
+    """
+    Reads the header of filename, up to the first data row, and builds
+    the Schema for it from the '# column format' and '# data columns'
+    lines.
+    """
+    column_format = None
+    data_columns = None
+    with compressed_files.open_file(filename) as f:
+        for line in f:
+            if line.startswith(COLUMN_FORMAT_HEADER):
+                column_format = line[len(COLUMN_FORMAT_HEADER):].split()
+            elif line.startswith(DATA_COLUMNS_HEADER):
+                data_columns = line[len(DATA_COLUMNS_HEADER):].split()
+            elif line[:1] != b'#' and line.strip():
+                return make_schema(column_format,data_columns,
+                                   len(line.split()))
+    return make_schema(column_format,data_columns)
+# ----------------------------------------------------------------------
+
+
+# The columnar store
+# ----------------------------------------------------------------------
+class Snapshots(object):
+    """
+    A columnar store for the data in a Cactus ASCII file.
+
+    columns is a dictionary mapping each name in METADATA_COLUMNS to a
+    one-dimensional numpy array with one entry per row. data is a
+    two-dimensional numpy array with one row per row in the file and
+    one column per data column. schema is the Schema of the file,
+    which names the data columns and says what kind of variable they
+    are. For a symmetric tensor, each row of data is
+
+    [Txx, Txy, Txz, Tyy, Tyz, Tzz]
+
+    The rows are sorted by iteration (stably, so rows within an
+    iteration keep the order they had in the file). iterations is the
+    sorted array of distinct iterations and offsets has length
+    len(iterations)+1. The rows in snapshot k are
+    offsets[k]:offsets[k+1].
+
+    A Snapshots object can be used as the list of snapshots described
+    at the top of this file. data[k] is a Snapshot and data[k][n] is
+    the nth row of it, built on demand. (Rows can only be built if
+    every metadata column was loaded. See project_schema.)
+    """
+    def __init__(self,columns,data,iterations,offsets,schema=None):
+        self.columns = columns
+        self.data = data
+        self.iterations = iterations
+        self.offsets = offsets
+        if schema is None:
+            schema = make_schema(num_columns=NUM_METADATA_COLUMNS \
+                                     + data.shape[1])
+        self.schema = schema
+        # Built the first time we look up a time. See time_index.
+        self._time_index = None
+
+    def __len__(self):
+        return len(self.iterations)
+
+    def __getitem__(self,index):
+        if isinstance(index,slice):
+            return [self[k] for k in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Snapshot index out of range.")
+        return Snapshot(self,index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield Snapshot(self,index)
+
+    def row_range(self,index):
+        "Returns the (start,stop) rows of the index-th snapshot."
+        return self.offsets[index],self.offsets[index+1]
+
+    def column(self,name,index=None):
+        """
+        Returns the column named name. If index is given, returns only
+        the rows in the index-th snapshot. This is a view, not a copy.
+        """
+        if index is None:
+            return self.columns[name]
+        start,stop = self.row_range(index)
+        return self.columns[name][start:stop]
+
+    def component(self,name,index=None):
+        """
+        Returns the data column named name (like 'gxy' or 'alp'). If
+        index is given, returns only the rows in the index-th
+        snapshot. This is a view, not a copy.
+        """
+        column = self.data[:,self.schema.data_names.index(name)]
+        if index is None:
+            return column
+        start,stop = self.row_range(index)
+        return column[start:stop]
+
+    def elements(self,i,j=0,index=None):
+        """
+        Returns the (i,j)th element of the variable (see data_index)
+        in every row, or only the rows in the index-th snapshot if
+        index is given. This is a view, not a copy.
+        """
+        column = self.data[:,data_index(self.schema,i,j)]
+        if index is None:
+            return column
+        start,stop = self.row_range(index)
+        return column[start:stop]
+
+    def tensor_components(self,index=None):
+        """
+        Returns the (N,6) block [Txx, Txy, Txz, Tyy, Tyz, Tzz] of a
+        symmetric tensor, for every row or only the rows in the
+        index-th snapshot. This is a view if the six components are
+        stored in that order, which they are unless the store was
+        loaded with only some of its columns.
+        """
+        if self.schema.kind != SYMMETRIC_TENSOR:
+            raise ValueError("The data is not a symmetric tensor.")
+        columns = [data_index(self.schema,*pair) \
+                       for pair in SYMMETRIC_TENSOR_PAIRS]
+        if columns == list(range(len(columns))) \
+                and self.data.shape[1] == len(columns):
+            block = self.data
+        else:
+            block = self.data[:,columns]
+        if index is None:
+            return block
+        start,stop = self.row_range(index)
+        return block[start:stop]
+
+    def tensors(self,index=None):
+        """
+        Returns the symmetric tensors as an (N,3,3) SymmetricTensors
+        view. See tensor_components.
+        """
+        return SymmetricTensors(self.tensor_components(index))
+
+    def data_of_snapshot(self,index):
+        "Returns the data block of the index-th snapshot. A view."
+        start,stop = self.row_range(index)
+        return self.data[start:stop]
+
+    def times(self):
+        "Returns the coordinate time of each snapshot."
+        return self.columns['time'][self.offsets[:-1]]
+
+    def time_index(self):
+        "Returns the TimeIndex of the snapshots. It's built only once."
+        if self._time_index is None:
+            self._time_index = TimeIndex(self.times(),self.iterations)
+        return self._time_index
+
+    def find_time(self,time,tolerance=TIME_TOLERANCE):
+        """
+        Returns the index of the snapshot at the given coordinate
+        time, give or take tolerance. Raises a ValueError if there
+        isn't one.
+        """
+        return self.time_index().find_time(time,tolerance)
+
+    def nearest_time(self,time):
+        "Returns the index of the snapshot closest to the given time."
+        return self.time_index().nearest_time(time)
+
+    def find_iteration(self,iteration):
+        """
+        Returns the index of the snapshot at the given iteration
+        number. Raises a ValueError if there isn't one.
+        """
+        return self.time_index().find_iteration(iteration)
+
+    def row(self,n):
+        """
+        Builds the nth row of the store in the list format described
+        at the top of this file.
+        """
+        c = self.columns
+        if self.data.shape[1] == 1:
+            data = self.data[n,0]
+        else:
+            data = self.data[n].copy()
+        return [int(c['it'][n]),int(c['tl'][n]),
+                np.array([c['rl'][n],c['c'][n],c['ml'][n]]),
+                np.array([c['ix'][n],c['iy'][n],c['iz'][n]]),
+                c['time'][n],
+                np.array([c['x'][n],c['y'][n],c['z'][n]]),
+                data]
+
+    def select_rows(self,rows):
+        """
+        Returns a new Snapshots store with only the given rows, which
+        can be a boolean mask or an array of row numbers that keeps
+        the snapshots in order.
+        """
+        columns = {name : column[rows] \
+                       for name,column in self.columns.items()}
+        iterations,offsets = make_iteration_index(columns['it'])
+        return Snapshots(columns,self.data[rows],iterations,offsets,
+                         self.schema)
+
+    def select_snapshots(self,indices):
+        """
+        Returns a new Snapshots store with only the snapshots with the
+        given (sorted) snapshot indices.
+        """
+        keep = np.zeros(len(self),dtype=bool)
+        keep[indices] = True
+        return self.select_rows(keep[self.snapshot_numbers()])
+
+    def refinement_levels(self):
+        "Returns the sorted refinement levels in the store."
+        return np.unique(self.columns['rl'])
+
+    def time_levels(self):
+        "Returns the sorted time levels in the store."
+        return np.unique(self.columns['tl'])
+
+    def select_levels(self,levels=None,time_levels=None):
+        """
+        Returns a new Snapshots store with only the rows on the given
+        refinement levels and time levels. Each is a list, or None for
+        all of them.
+        """
+        keep = np.ones(len(self.columns['it']),dtype=bool)
+        if levels is not None:
+            keep &= np.isin(self.columns['rl'],levels)
+        if time_levels is not None:
+            keep &= np.isin(self.columns['tl'],time_levels)
+        return self.select_rows(keep)
+
+    def finest(self,time_level=CURRENT_TIME_LEVEL):
+        """
+        Returns a new Snapshots store that is the composite of the
+        finest data available at every point, on one time level. A
+        row is dropped if it's on another time level, or if, in the
+        same snapshot, a component of a finer refinement level covers
+        its position. (A component covers the box between its
+        smallest and largest coordinates.) The rows of each snapshot
+        are sorted by position, z slowest and x fastest, so the levels
+        make one line.
+
+        Needs the FINEST_FIELDS. ('c' is optional.)
+        """
+        store = self.select_levels(time_levels=[time_level])
+        snapshots = store.snapshot_numbers()
+        rl = store.columns['rl']
+        component = store.columns['c'] if 'c' in store.columns \
+            else np.zeros_like(rl)
+        covered = np.zeros(len(rl),dtype=bool)
+        for level in store.refinement_levels()[1:]:
+            on_level = rl == level
+            for c in np.unique(component[on_level]):
+                box = on_level & (component == c)
+                inside = rl < level
+                for name in POSITION_COLUMNS:
+                    position = store.columns[name]
+                    lower = np.full(len(store),np.inf)
+                    upper = np.full(len(store),-np.inf)
+                    np.minimum.at(lower,snapshots[box],position[box])
+                    np.maximum.at(upper,snapshots[box],position[box])
+                    inside &= (lower[snapshots] <= position) \
+                        & (position <= upper[snapshots])
+                covered |= inside
+        keep = np.flatnonzero(~covered)
+        keys = [store.columns[name][keep] for name in POSITION_COLUMNS]
+        order = np.lexsort(keys + [snapshots[keep]])
+        return store.select_rows(keep[order])
+
+    def snapshot_numbers(self):
+        "Returns the index of the snapshot each row belongs to."
+        return np.repeat(np.arange(len(self)),np.diff(self.offsets))
+
+    def to_arrays(self):
+        """
+        Returns a flat dictionary of every array in the store. The
+        inverse of snapshots_from_arrays.
+        """
+        arrays = dict(self.columns)
+        arrays['data'] = self.data
+        arrays['iterations'] = self.iterations
+        arrays['offsets'] = self.offsets
+        return arrays
+
+
+class Snapshot(object):
+    """
+    One snapshot of a Snapshots store. Behaves like the list of rows
+    described at the top of this file, but only holds a reference to
+    the store and its index in it.
+    """
+    def __init__(self,store,index):
+        self.store = store
+        self.index = index
+        self.start,self.stop = store.row_range(index)
+
+    def __len__(self):
+        return int(self.stop - self.start)
+
+    def __getitem__(self,n):
+        if isinstance(n,slice):
+            return [self[k] for k in range(*n.indices(len(self)))]
+        if n < 0:
+            n += len(self)
+        if not 0 <= n < len(self):
+            raise IndexError("Row index out of range.")
+        return self.store.row(self.start + n)
+
+    def __iter__(self):
+        for n in range(self.start,self.stop):
+            yield self.store.row(n)
+
+    def column(self,name):
+        "Returns the column named name for this snapshot. A view."
+        return self.store.columns[name][self.start:self.stop]
+
+    def data(self):
+        "Returns the data block for this snapshot. A view."
+        return self.store.data[self.start:self.stop]
+
+    def elements(self,i,j=0):
+        "Returns the (i,j)th element in every row. A view."
+        return self.store.elements(i,j,self.index)
+
+    def tensor_components(self):
+        "Returns the (N,6) symmetric tensor block of this snapshot."
+        return self.store.tensor_components(self.index)
+
+    def tensors(self):
+        "Returns an (N,3,3) SymmetricTensors view of this snapshot."
+        return SymmetricTensors(self.tensor_components())
+
+
+class SymmetricTensors(object):
+    """
+    An (N,3,3) view of N symmetric tensors that are stored as an (N,6)
+    block [Txx, Txy, Txz, Tyy, Tyz, Tzz]. Nothing is copied.
+
+    tensors[:,i,j] (or any rows instead of :) is a single indexed
+    gather into the block, and is a view when the rows are a slice.
+    tensors[n] is the nth tensor as a 3x3 array. np.asarray(tensors)
+    builds the full (N,3,3) array in one gather.
+
+    Numpy can't describe the symmetric layout with strides (Tyy is
+    not one step from Txy in both directions), so an ndarray with
+    shape (N,3,3) is always a copy. This class is the zero-copy
+    version.
+    """
+    def __init__(self,block):
+        block = np.asarray(block)
+        assert block.ndim == 2 and block.shape[1] == 6 \
+            and "A symmetric tensor has six components."
+        self.block = block
+
+    @property
+    def shape(self):
+        return (len(self.block),3,3)
+
+    def __len__(self):
+        return len(self.block)
+
+    def __getitem__(self,key):
+        if isinstance(key,tuple) and len(key) == 3 \
+                and np.isscalar(key[1]) and np.isscalar(key[2]):
+            rows,i,j = key
+            return self.block[rows,tensor_index(i,j)]
+        return self.block[...,SYMMETRIC_TENSOR_INDEX][key]
+
+    def __array__(self,dtype=None,copy=None):
+        tensors = self.block[:,SYMMETRIC_TENSOR_INDEX]
+        return tensors if dtype is None else tensors.astype(dtype)
+
+    def element(self,i,j):
+        "Returns the (i,j)th element of every tensor. A view."
+        return self.block[:,tensor_index(i,j)]
+
+
+class TimeIndex(object):
+    """
+    Finds snapshots by coordinate time or by iteration number with a
+    binary search, instead of a linear search like times.index(time).
+
+    Times are compared with a tolerance, so a time that went through
+    a little floating point error (0.30000000000000004 instead of 0.3)
+    still matches.
+    """
+    def __init__(self,times,iterations=None):
+        times = np.asarray(times,dtype=float)
+        self.order = np.argsort(times,kind='mergesort')
+        self.sorted_times = times[self.order]
+        if iterations is not None:
+            iterations = np.asarray(iterations)
+            self.iteration_order = np.argsort(iterations,kind='mergesort')
+            self.sorted_iterations = iterations[self.iteration_order]
+        else:
+            self.iteration_order = None
+            self.sorted_iterations = None
+
+    def __len__(self):
+        return len(self.order)
+
+    def nearest_position(self,time):
+        "Returns the position in sorted_times closest to time."
+        if len(self) == 0:
+            raise ValueError("There are no snapshots.")
+        k = np.searchsorted(self.sorted_times,time)
+        if k == len(self) or (k > 0 and time - self.sorted_times[k-1] \
+                                  <= self.sorted_times[k] - time):
+            k -= 1
+        return k
+
+    def nearest_time(self,time):
+        "Returns the index of the snapshot closest to time."
+        return int(self.order[self.nearest_position(time)])
+
+    def find_time(self,time,tolerance=TIME_TOLERANCE):
+        """
+        Returns the index of the snapshot closest to time, if it's
+        within tolerance of it. Otherwise raises a ValueError.
+        """
+        if len(self) > 0:
+            k = self.nearest_position(time)
+            if abs(self.sorted_times[k] - time) <= tolerance:
+                return int(self.order[k])
+        raise ValueError("There is no snapshot at time {}.".format(time))
+
+    def find_times_between(self,first,last,tolerance=TIME_TOLERANCE):
+        """
+        Returns the indices of the snapshots with first <= time <=
+        last, give or take tolerance, in time order.
+        """
+        start = np.searchsorted(self.sorted_times,first - tolerance,
+                                side='left')
+        stop = np.searchsorted(self.sorted_times,last + tolerance,
+                               side='right')
+        return self.order[start:stop]
+
+    def find_iteration(self,iteration):
+        """
+        Returns the index of the snapshot at the given iteration.
+        Raises a ValueError if there isn't one, or if the index was
+        built without iterations.
+        """
+        if self.sorted_iterations is None:
+            raise ValueError("There is no snapshot at iteration {}: "
+                             "the index has no iterations.".format(iteration))
+        k = np.searchsorted(self.sorted_iterations,iteration)
+        if k == len(self) or self.sorted_iterations[k] != iteration:
+            raise ValueError("There is no snapshot at iteration {}."\
+                                 .format(iteration))
+        return int(self.iteration_order[k])
+
+
+def time_window(time,tolerance=TIME_TOLERANCE):
+    """
+    Returns the window of times (see make_window) that matches time,
+    give or take tolerance.
+    """
+    return (time - tolerance,time + tolerance)
+
+
+def make_snapshots(table,schema=None):
+    """
+    Takes a two-dimensional array with one row per line of a Cactus
+    ASCII file, as returned by np.loadtxt, and builds a Snapshots
+    store out of it. schema says which column is which (see
+    read_schema). If it isn't given, we assume the standard layout.
+    """
+    table = np.atleast_2d(table)
+    if schema is None:
+        schema = make_schema(num_columns=table.shape[1])
+    iteration = table[:,schema.metadata['it']].astype(np.int64)
+    # Rows are almost always already sorted. Only shuffle if not.
+    if len(iteration) > 1 and np.any(np.diff(iteration) < 0):
+        order = np.argsort(iteration,kind='mergesort')
+        table = table[order]
+        iteration = iteration[order]
+    columns = {}
+    for name in METADATA_COLUMNS:
+        if name not in schema.metadata:
+            continue
+        if name == 'it':
+            columns[name] = iteration
+        elif name in INTEGER_COLUMNS:
+            columns[name] = table[:,schema.metadata[name]].astype(np.int64)
+        else:
+            columns[name] = np.ascontiguousarray(table[:,schema.metadata[name]])
+    data = np.ascontiguousarray(table[:,schema.data_columns])
+    return Snapshots(columns,data,*make_iteration_index(iteration),
+                     schema=schema)
+
+
+def snapshots_from_arrays(arrays,schema=None):
+    """
+    Rebuilds a Snapshots store from the dictionary made by
+    Snapshots.to_arrays.
+    """
+    columns = {name : arrays[name] for name in METADATA_COLUMNS \
+                   if name in arrays}
+    return Snapshots(columns,arrays['data'],
+                     arrays['iterations'],arrays['offsets'],schema)
+
+
+def make_iteration_index(iteration):
+    """
+    Takes the sorted iteration column of a store and returns the
+    distinct iterations and the row offsets of each of them.
+    """
+    if len(iteration) == 0:
+        return iteration,np.zeros(1,dtype=np.int64)
+    starts = np.flatnonzero(np.diff(iteration)) + 1
+    offsets = np.concatenate(([0],starts,[len(iteration)])).astype(np.int64)
+    return iteration[offsets[:-1]],offsets
+
+
+def unique_row_mask(data,rule=DUPLICATE_RULE):
+    """
+    Takes a Snapshots store and returns a boolean mask that is True
+    for exactly one row per point. A point is a distinct (iteration,
+    tl, rl, ix, iy, iz). rule, one of DUPLICATE_RULES, decides which
+    copy of a duplicated point wins.
+
+    When the grid indices are compact (they always are for Cactus
+    output) this is done with a lookup table in linear time. Otherwise
+    we fall back on a sort.
+    """
+    assert rule in DUPLICATE_RULES and "Unknown rule for duplicate points."
+    num_rows = len(data.columns['it'])
+    if num_rows == 0:
+        return np.zeros(0,dtype=bool)
+    # rank is the order of preference of each row. Lowest rank wins.
+    if rule == 'first':
+        rank = np.arange(num_rows)
+    elif rule == 'last':
+        rank = np.arange(num_rows)[::-1].copy()
+    else:
+        component = data.columns['c']
+        if rule == 'highest_component':
+            component = -component
+        rank = np.empty(num_rows,dtype=np.int64)
+        rank[np.argsort(component,kind='mergesort')] = np.arange(num_rows)
+    fields = [data.snapshot_numbers()] \
+        + [data.columns[name] for name in DUPLICATE_KEY_COLUMNS]
+    fields = [field - field.min() for field in fields]
+    sizes = [int(field.max()) + 1 for field in fields]
+    table_size = 1
+    for size in sizes:
+        table_size *= size
+    if table_size <= DENSE_KEY_FACTOR*num_rows:
+        key = np.zeros(num_rows,dtype=np.int64)
+        for field,size in zip(fields,sizes):
+            key = key*size + field
+        best = np.empty(table_size,dtype=rank.dtype)
+        best.fill(num_rows)
+        np.minimum.at(best,key,rank)
+        return best[key] == rank
+    # Sort by point, then by rank. The first row of each point wins.
+    order = np.lexsort([rank] + fields[::-1])
+    new_point = np.zeros(num_rows,dtype=bool)
+    new_point[0] = True
+    for field in fields:
+        sorted_field = field[order]
+        new_point[1:] |= sorted_field[1:] != sorted_field[:-1]
+    mask = np.zeros(num_rows,dtype=bool)
+    mask[order[new_point]] = True
+    return mask
+
+
+def deduplicate(data,rule=DUPLICATE_RULE):
+    """
+    Takes a Snapshots store and returns a store with only one copy of
+    every point, so that ghost points and overlapping components
+    aren't counted twice. rule is one of DUPLICATE_RULES, or None to
+    keep every row.
+    """
+    if rule is None or len(data.columns['it']) == 0:
+        return data
+    mask = unique_row_mask(data,rule)
+    if np.all(mask):
+        return data
+    return data.select_rows(mask)
+
+
+def project_store(data,schema):
+    """
+    Takes a Snapshots store and a schema made from its schema by
+    project_schema, and returns a store with only the columns in the
+    projected schema.
+    """
+    columns = {name : data.columns[name] for name in schema.metadata}
+    rows = [data.schema.data_names.index(name) for name in schema.data_names]
+    return Snapshots(columns,data.data[:,rows],data.iterations,data.offsets,
+                     schema)
+
+
+def join_snapshots(stores):
+    """
+    Joins several Snapshots stores with the same columns into one, in
+    order. Nothing is merged, so an iteration in two stores shows up
+    twice.
+    """
+    stores = [store for store in stores if len(store) > 0]
+    if not stores:
+        raise ValueError("There are no snapshots to join.")
+    if len(stores) == 1:
+        return stores[0]
+    columns = {name : np.concatenate([store.columns[name] \
+                                          for store in stores]) \
+                   for name in stores[0].columns}
+    data = np.concatenate([store.data for store in stores])
+    iterations = np.concatenate([store.iterations for store in stores])
+    bases = np.cumsum([0] + [len(store.data) for store in stores])
+    offsets = np.concatenate([store.offsets[:-1] + base \
+                                  for store,base in zip(stores,bases)] \
+                                 + [bases[-1:]])
+    return Snapshots(columns,data,iterations,offsets,stores[0].schema)
+
+
+def is_store(data):
+    "True if data is a Snapshots store rather than a list of lists."
+    return isinstance(data,Snapshots)
+
+
+def is_store_snapshot(snapshot):
+    "True if snapshot is a Snapshot view rather than a list of rows."
+    return isinstance(snapshot,Snapshot)
+# ----------------------------------------------------------------------
+
+
+# Following a simulation that is still running
+# ----------------------------------------------------------------------
+class Follower(object):
+    """
+    Reads a file that Cactus is still writing to, a little at a time.
+
+    Each call to update parses only the snapshots written since the
+    last call. The follower remembers the byte offset it stopped at
+    and the last complete iteration. The last iteration in the file
+    may still be being written (other components or refinement levels
+    may be on their way), so it is only read once the next iteration
+    starts, or when update is called with final=True.
+
+    Anything computed with accumulate (like reductions) is only
+    computed for the new snapshots, so the cost of a refresh scales
+    with the new output, not with the size of the file.
+
+    The file needs '# iteration' headers, which CarpetIOASCII always
+    writes. If the file shrinks (the run was started over), the
+    follower starts over too.
+    """
+    def __init__(self,filename,duplicates=DUPLICATE_RULE,
+                 components=None,fields=None):
+        self.filename = filename
+        self.duplicates = duplicates
+        self.components = components
+        self.fields = fields
+        self.reset()
+
+    def reset(self):
+        "Forgets everything read so far."
+        self.offset = 0
+        self.last_iteration = None
+        self.stores = []
+        # The stores joined into one, and how many of them
+        self.joined = (0,None)
+        self.usecols = None
+        self.schema = None
+        self.results = {}
+
+    def update(self,final=False):
+        """
+        Parses the complete snapshots written since the last call and
+        returns them as a Snapshots store, or returns None if there
+        aren't any. If final is true, the last iteration in the file
+        is taken to be complete.
+        """
+        if os.path.getsize(self.filename) < self.offset:
+            self.reset()
+        index = scan_iteration_offsets(self.filename,first_byte=self.offset)
+        offsets = index['offsets']
+        if final:
+            stop = last_line_end(self.filename,self.offset,offsets[-1])
+        elif len(offsets) > 2:
+            # The last iteration may not be finished
+            stop = offsets[-2]
+        else:
+            return None
+        if stop <= self.offset:
+            return None
+        if self.schema is None:
+            self.usecols,self.schema = prepare_schema(self.filename,
+                                                      self.components,
+                                                      self.fields,
+                                                      self.duplicates)
+        chunk = (self.filename,int(self.offset),int(stop),self.usecols)
+        table = parse_byte_range(chunk)
+        self.offset = stop
+        if table.size == 0:
+            return None
+        data = deduplicate(make_snapshots(table,self.schema),self.duplicates)
+        self.stores.append(data)
+        self.last_iteration = int(data.iterations[-1])
+        return data
+
+    def data(self):
+        """
+        Returns every complete snapshot read so far as one Snapshots
+        store, or None if there aren't any yet. The stores are only
+        joined when this is called and something new was read.
+        """
+        if not self.stores:
+            return None
+        if self.joined[0] < len(self.stores):
+            self.joined = (len(self.stores),join_snapshots(self.stores))
+        return self.joined[1]
+
+    def accumulate(self,key,function):
+        """
+        Applies function to the snapshots read since the last call
+        with the same key, and returns the results for every snapshot
+        so far. function takes a Snapshots store and returns an array
+        with one entry per snapshot, or a tuple or dictionary of such
+        arrays. The results for older snapshots are kept, so each
+        snapshot is only ever looked at once.
+        """
+        seen,results = self.results.get(key,(0,None))
+        for store in self.stores[seen:]:
+            results = extend_results(results,function(store))
+        self.results[key] = (len(self.stores),results)
+        return results
+
+    def reductions(self,i,j,reductions=REDUCTIONS,weights=None):
+        """
+        Returns times and the reductions of the (i,j)th component of
+        the tensor for every snapshot so far, like reductions_of_time.
+        Only new snapshots are reduced, so weights must be a number
+        (like the lattice spacing) or None.
+        """
+        key = ('reductions',i,j,tuple(reductions),weights)
+        function = lambda data: reductions_of_time(i,j,data,
+                                                   reductions,weights)
+        return self.accumulate(key,function)
+
+
+def extend_results(results,new):
+    """
+    Appends new results to old results for Follower.accumulate. Both
+    are arrays, or tuples or dictionaries of arrays.
+    """
+    if results is None:
+        return new
+    if isinstance(new,dict):
+        return {name : np.concatenate((results[name],new[name])) \
+                    for name in new}
+    if isinstance(new,tuple):
+        return tuple(extend_results(old,part) \
+                         for old,part in zip(results,new))
+    return np.concatenate((results,new))
+
+
+def last_line_end(filename,start,stop):
+    """
+    Returns the offset just past the last newline between byte start
+    and byte stop of filename, so a half-written last line is left
+    out. Returns start if there isn't one.
+    """
+    position = stop
+    with open(filename,'rb') as f:
+        while position > start:
+            size = min(SCAN_CHUNK_SIZE,position - start)
+            f.seek(position - size)
+            k = f.read(size).rfind(b'\n')
+            if k >= 0:
+                return position - size + k + 1
+            position -= size
+    return start
 # ----------------------------------------------------------------------
 
 def find_largest_index_of_subvalue(collection, value):
@@ -113,56 +1160,660 @@ def lose_ghost_points(snapshot):
     points. We don't want to double count these. This method removes
     the ghost points.
     """
+    if is_store_snapshot(snapshot):
+        store = snapshot.store.select_rows(np.arange(snapshot.start,
+                                                     snapshot.stop))
+        return deduplicate(store)[0]
     # We iterate through each row in the snapshot. If the position in
     # that row is in the positions set, we delete that row. Otherwise,
     # we add the positions to the positions set.
-    positions = []
+    positions = set()
     for i in range(len(snapshot)):
-        if list(snapshot[i][3]) in positions:
+        position = tuple(snapshot[i][3])
+        if position in positions:
             snapshot[i] = False
         else:
-            positions.append(list(snapshot[i][3]))
-    snapshot = filter(lambda row: bool(row), snapshot)
+            positions.add(position)
+    snapshot = filter(lambda row: row is not False, snapshot)
     return snapshot
 
 
-def extract_data(filename):
+def extract_data(filename,use_cache=USE_CACHE,workers=PARSE_WORKERS,
+                 duplicates=DUPLICATE_RULE,components=None,fields=None,
+                 iterations=None,times=None,levels=None):
     """
     Extracts the data from a file and makes a list of snapshots as
-    defined above in the approach.
+    defined above in the approach. The list is really a Snapshots
+    store.
+
+    If use_cache is true, the parsed columns are saved in a binary
+    sidecar next to the file and later calls memory-map the sidecar
+    instead of parsing the file again. See ascii_cache.py.
+
+    workers is the number of processes used to parse the file. See
+    parse_file.
+
+    Points that show up more than once in a snapshot (ghost points and
+    overlapping components) are removed according to duplicates,
+    which is one of DUPLICATE_RULES or None to keep every row. The
+    cache always holds every row.
+
+    components and fields pick out the data components (like (0,1) or
+    'gxy') and the metadata fields (like 'x') we want. Everything else
+    is dropped as soon as each chunk of the file is parsed, so memory
+    scales with the columns asked for. See project_schema. A load like
+    this uses the cache if it's there, but doesn't write it.
+
+    iterations and times pick out the snapshots we want. Each is a
+    window, as described in make_window. Snapshots outside the windows
+    are skipped without being parsed, and the file is only read up to
+    the end of the last window. A windowed load uses the caches if
+    they're there, but doesn't write them. Raises a ValueError if no
+    snapshot is in the windows.
+
+    levels picks out refinement levels. It is a list of the levels we
+    want, FINEST for the composite of the finest data available at
+    every point on the current time level (see Snapshots.finest), or
+    None for every level.
+
+    filename can be compressed (see compressed_files.py). If it
+    doesn't exist but a compressed version of it does, we use that.
+
+    filename can also be CarpetIOHDF5 output or a table of an archive
+    (see find_reader). Then use_cache and workers are ignored.
+    """
+    filename = compressed_files.find_file(filename)
+    fields = level_fields(fields,levels)
+    reader = find_reader(filename)
+    if reader is not None:
+        data = reader.extract_data(filename,duplicates,components,fields,
+                                   iterations,times,
+                                   None if levels == FINEST else levels)
+        return select_levels(data,levels)
+    usecols,schema = prepare_schema(filename,components,fields,duplicates)
+    windowed = iterations is not None or times is not None
+    data = None
+    if use_cache:
+        arrays = ascii_cache.load_arrays(filename,CACHE_KIND)
+        if arrays is not None:
+            data = snapshots_from_arrays(arrays,read_schema(filename))
+            if usecols is not None:
+                data = project_store(data,schema)
+            if windowed:
+                data = data.select_snapshots(select_window(data.iterations,
+                                                           data.times(),
+                                                           iterations,times))
+    if data is None and windowed:
+        index = get_window_index(filename,iterations,times,use_cache)
+        selected = select_window(index['iterations'],index['times'],
+                                 iterations,times)
+        if len(index['offsets']) == 1:
+            # No headers to find the snapshots by. Parse everything.
+            data = make_snapshots(parse_file(filename,workers,usecols,
+                                             use_cache),schema)
+            data = data.select_snapshots(select_window(data.iterations,
+                                                       data.times(),
+                                                       iterations,times))
+        elif len(selected) > 0:
+            chunks = plan_window_chunks(filename,index,selected,usecols)
+            data = make_snapshots(parse_chunks(filename,chunks,workers),
+                                  schema)
+            # A chunk of a compressed file may hold extra snapshots
+            wanted = np.isin(data.iterations,index['iterations'][selected])
+            data = data.select_snapshots(np.flatnonzero(wanted))
+    elif data is None:
+        data = make_snapshots(parse_file(filename,workers,usecols,use_cache),
+                              schema)
+        if use_cache and usecols is None:
+            ascii_cache.save_arrays(filename,CACHE_KIND,data.to_arrays())
+    if data is None or len(data) == 0:
+        raise ValueError("{} has no snapshots in the window.".format(filename))
+    return select_levels(deduplicate(data,duplicates),levels)
+
+def level_fields(fields,levels):
+    """
+    Takes the fields and levels passed to extract_data and returns the
+    fields, plus the ones we need to pick out the levels.
+    """
+    if fields is None or levels is None:
+        return fields
+    needed = FINEST_FIELDS if levels == FINEST else ['rl']
+    return list(fields) + [name for name in needed if name not in fields]
+
+def select_levels(data,levels):
+    """
+    Takes a Snapshots store and picks out the refinement levels, as
+    described in extract_data.
+    """
+    if levels is None:
+        return data
+    if levels == FINEST:
+        return data.finest()
+    return data.select_levels(levels)
+
+def make_window(window):
+    """
+    Takes a window of iterations or times and returns a tuple
+
+    (first, last, stride)
+
+    A window can be
+
+    a single value, which must match exactly (like times.index(time));
+    a pair (first, last), for every snapshot from first to last,
+    including both ends; or
+    a triple (first, last, stride), for every stride-th snapshot in
+    the range, starting with the first.
+
+    first and last can be None for no bound.
+    """
+    if np.isscalar(window):
+        return window,window,1
+    window = tuple(window)
+    if len(window) == 2:
+        window += (1,)
+    if len(window) != 3:
+        raise ValueError("A window is a value, (first,last) "
+                         +"or (first,last,stride).")
+    first,last,stride = window
+    if stride is None:
+        stride = 1
+    if int(stride) != stride or stride < 1:
+        raise ValueError("The stride of a window must be a positive integer.")
+    first = -np.inf if first is None else first
+    last = np.inf if last is None else last
+    return first,last,int(stride)
+
+def select_window(iterations,times,iteration_window=None,time_window=None):
+    """
+    Takes the iteration and time of every snapshot and returns the
+    indices of the snapshots inside both windows (see make_window). A
+    window of None lets everything through.
+    """
+    keep = np.ones(len(iterations),dtype=bool)
+    for values,window in [(iterations,iteration_window),
+                          (times,time_window)]:
+        if window is None:
+            continue
+        first,last,stride = make_window(window)
+        inside = np.flatnonzero((values >= first) & (values <= last))
+        mask = np.zeros(len(iterations),dtype=bool)
+        mask[inside[::stride]] = True
+        keep &= mask
+    return np.flatnonzero(keep)
+
+def get_window_index(filename,iterations=None,times=None,
+                     use_cache=USE_CACHE):
+    """
+    Returns a byte-offset index (see scan_iteration_offsets) that
+    covers at least every snapshot inside the windows (see
+    make_window).
+
+    If the full index is cached, we use it. Otherwise the file is
+    scanned for headers only until we pass the end of the windows.
+    Cactus writes iterations in increasing order, so nothing after
+    that point can be in the windows.
+    """
+    if use_cache:
+        index = ascii_cache.load_arrays(filename,OFFSET_INDEX_KIND)
+        if index is not None:
+            return index
+    last_iteration = last_time = None
+    if iterations is not None:
+        last_iteration = make_window(iterations)[1]
+    if times is not None:
+        last_time = make_window(times)[1]
+    return scan_iteration_offsets(filename,last_iteration,last_time)
+
+def plan_window_chunks(filename,index,selected,usecols=None):
     """
-    data = np.loadtxt(filename)
-    snapshots = {int(line[0]) : [] for line in data}
-    for row in data:
-        # Convenience variable definitions
-        time_step = int(row[0])
-        tl = int(row[1])
-        rl = int(row[2])
-        c = int(row[3])
-        ml = int(row[4])
-        ix = int(row[5])
-        iy = int(row[6])
-        iz = int(row[7])
-        t = row[8]
-        x = row[9]
-        y = row[10]
-        z = row[11]
-        Txx = row[12]
-        Txy = row[13]
-        Txz = row[14]
-        Tyy = row[15]
-        Tyz = row[16]
-        Tzz = row[17]
-        snapshot_row = [time_step,tl,
-                        np.array([rl,c,ml]),
-                        np.array([ix,iy,iz]),
-                        t, np.array([x,y,z]),
-                        np.array([Txx,Txy,Txz,Tyy,Tyz,Tzz])]
-        snapshots[row[0]].append(snapshot_row)
-    keys = snapshots.keys()
-    keys.sort()
-    snapshots_list = [snapshots[keys[i]] for i in range(len(keys))]
-    return snapshots_list
+    Takes a byte-offset index and the indices of the snapshots we want
+    and returns the byte ranges (filename,start,stop,usecols) that
+    hold them, merging ranges that touch.
+
+    A compressed file has to be decompressed from the start to get to
+    any byte range, so for those we return one range from the first
+    snapshot we want to the last. It may hold snapshots we don't want.
+    """
+    offsets = index['offsets']
+    if compressed_files.is_compressed(filename):
+        return [(filename,int(offsets[selected[0]]),
+                 int(offsets[selected[-1]+1]),usecols)]
+    chunks = []
+    for k in selected:
+        start,stop = int(offsets[k]),int(offsets[k+1])
+        if chunks and chunks[-1][2] == start:
+            start = chunks.pop()[1]
+        chunks.append((filename,start,stop,usecols))
+    return chunks
+
+def parse_rows(lines,usecols=None):
+    """
+    Takes a list of data lines from a Cactus ASCII file (no comments)
+    and parses them into a two-dimensional array with one row per
+    line. If usecols is given, only those columns are kept.
+    """
+    num_columns = len(lines[0].split())
+    table = np.fromstring(b''.join(lines),sep=' ')
+    if table.size != num_columns*len(lines):
+        raise ValueError("Rows of a Cactus ASCII file have different lengths.")
+    table = table.reshape(len(lines),num_columns)
+    if usecols is not None:
+        table = table[:,usecols]
+    return table
+
+def parse_text(text,usecols=None):
+    """
+    Takes a piece of a Cactus ASCII file made up of whole lines and
+    parses it into a two-dimensional array with one row per data
+    line. Comment lines and blank lines are ignored. If usecols is
+    given, only those columns are kept.
+
+    Raises a ValueError if the rows have different lengths or a value
+    can't be parsed (np.fromstring just stops there).
+    """
+    text = COMMENT_LINE.sub(b'',text)
+    num_columns = len(text.lstrip().split(b'\n',1)[0].split())
+    if num_columns == 0:
+        return np.zeros((0,0))
+    # Every line that isn't blank is a row
+    lines = b'\n' + text + b'\n'
+    num_rows = lines.count(b'\n') - 1 - len(BLANK_LINE.findall(lines))
+    table = np.fromstring(text,sep=' ')
+    if table.size != num_columns*num_rows:
+        raise ValueError("Rows of a Cactus ASCII file have different lengths.")
+    table = table.reshape(num_rows,num_columns)
+    if usecols is not None:
+        table = table[:,usecols]
+    return table
+
+def parse_byte_range(chunk):
+    """
+    Takes a tuple (filename,start,stop,usecols) and parses the rows
+    between byte start and byte stop of filename with parse_text. The
+    range must start and end on line boundaries.
+
+    This is what the workers in parse_file run.
+    """
+    filename,start,stop,usecols = chunk
+    text = b''.join(compressed_files.read_chunks(filename,max(stop-start,1),
+                                                 start,stop))
+    return parse_text(text,usecols)
+
+def plan_chunks(filename,workers=PARSE_WORKERS,usecols=None,
+                use_cache=USE_CACHE):
+    """
+    Splits filename into byte ranges (filename,start,stop,usecols)
+    that start and end on iteration boundaries, so every chunk holds
+    whole snapshots. Uses the byte-offset index, which is cached if
+    use_cache is true (see get_iteration_offsets).
+    """
+    offsets = get_iteration_offsets(filename,use_cache)['offsets']
+    size = offsets[-1]
+    num_chunks = max(workers*CHUNKS_PER_WORKER if workers > 1 else 1,
+                     int(np.ceil(float(size)/PARSE_CHUNK_SIZE)))
+    targets = np.linspace(0,size,num_chunks+1)[1:-1]
+    cuts = np.unique(offsets[np.searchsorted(offsets,targets)])
+    boundaries = np.concatenate(([0],cuts[(cuts > 0) & (cuts < size)],[size]))
+    return [(filename,int(boundaries[k]),int(boundaries[k+1]),usecols) \
+                for k in range(len(boundaries)-1)]
+
+def parse_file(filename,workers=PARSE_WORKERS,usecols=None,
+               use_cache=USE_CACHE):
+    """
+    Parses every data row of filename into one two-dimensional array,
+    as np.loadtxt would. If usecols is given, only those columns are
+    kept. Each chunk is cut down right after it's parsed, so the full
+    width of the file is never in memory all at once.
+
+    The file is cut into chunks on iteration boundaries. If workers is
+    more than 1, the chunks are parsed by a pool of that many
+    processes. Either way the chunks are parsed by the same code and
+    stitched back together in file order, so the result doesn't depend
+    on the number of workers.
+
+    Compressed files can't be cut into chunks without decompressing
+    them, so they are parsed as they stream in instead (see
+    parse_stream).
+
+    use_cache is passed to plan_chunks.
+    """
+    if compressed_files.is_compressed(filename):
+        return parse_stream(filename,usecols)
+    return parse_chunks(filename,plan_chunks(filename,workers,usecols,
+                                             use_cache),workers)
+
+def parse_stream(filename,usecols=None):
+    """
+    Parses every data row of filename, PARSE_CHUNK_SIZE bytes at a
+    time, as the bytes are read. For a compressed file the next chunk
+    is decompressed on a background thread while this one is parsed.
+    """
+    tables = []
+    rest = b''
+    for chunk in compressed_files.read_chunks(filename,PARSE_CHUNK_SIZE):
+        text = rest + chunk
+        cut = text.rfind(b'\n') + 1
+        rest = text[cut:]
+        tables.append(parse_text(text[:cut],usecols))
+    tables.append(parse_text(rest,usecols))
+    tables = [table for table in tables if table.size > 0]
+    if not tables:
+        raise ValueError("{} has no data in it.".format(filename))
+    return np.concatenate(tables)
+
+def parse_chunks(filename,chunks,workers=PARSE_WORKERS):
+    """
+    Parses a list of byte ranges (filename,start,stop,usecols) of
+    filename and stitches the rows together in order. If workers is
+    more than 1, the chunks are parsed by a pool of that many
+    processes.
+    """
+    if workers > 1 and len(chunks) > 1:
+        pool = multiprocessing.Pool(workers)
+        try:
+            tables = pool.map(parse_byte_range,chunks,chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        tables = [parse_byte_range(chunk) for chunk in chunks]
+    tables = [table for table in tables if table.size > 0]
+    if not tables:
+        raise ValueError("{} has no data in it.".format(filename))
+    return np.concatenate(tables)
+
+def iterate_blocks(filename):
+    """
+    Reads a file one component block at a time, cutting at the blank
+    lines that separate blocks. (These are the same blocks
+    get_iterations finds.) Yields pairs
+
+    (iteration, lines)
+
+    where lines is a list of the data lines in the block. Comment
+    lines are dropped. The iteration comes from the '# iteration'
+    header of the block, or from the first row if there is no header.
+    """
+    iteration = None
+    lines = []
+    for line in compressed_files.iterate_lines(filename):
+        if line[:1] == b'#':
+            if line.startswith(ITERATION_HEADER):
+                iteration = int(line.split()[2])
+        elif line.strip():
+            lines.append(line)
+        elif lines:
+            if iteration is None:
+                iteration = int(float(lines[0].split()[0]))
+            yield iteration,lines
+            iteration = None
+            lines = []
+    if lines:
+        if iteration is None:
+            iteration = int(float(lines[0].split()[0]))
+        yield iteration,lines
+
+def iterate_snapshots(filename,duplicates=DUPLICATE_RULE,
+                      components=None,fields=None):
+    """
+    A generator version of extract_data. Reads the file one iteration
+    at a time and yields each snapshot in turn as a Snapshot. Only one
+    snapshot is ever held in memory, so this works for files much
+    bigger than the memory of the machine.
+
+    Snapshots come out in file order, which for Cactus output is
+    iteration order. Duplicate points are removed, and columns are
+    picked out, as in extract_data.
+    """
+    filename = compressed_files.find_file(filename)
+    reader = find_reader(filename)
+    if reader is not None:
+        for snapshot in reader.iterate_snapshots(filename,duplicates,
+                                                 components,fields):
+            yield snapshot
+        return
+    usecols,schema = prepare_schema(filename,components,fields,duplicates)
+    iteration = None
+    lines = []
+    for block_iteration,block_lines in iterate_blocks(filename):
+        if lines and block_iteration != iteration:
+            data = make_snapshots(parse_rows(lines,usecols),schema)
+            for snapshot in deduplicate(data,duplicates):
+                yield snapshot
+            lines = []
+        iteration = block_iteration
+        lines.extend(block_lines)
+    if lines:
+        data = make_snapshots(parse_rows(lines,usecols),schema)
+        for snapshot in deduplicate(data,duplicates):
+            yield snapshot
+
+def parse_iteration_header(lines):
+    """
+    Takes the '# iteration' header line of a block (and the line after
+    it, which may be a '# time' line) and returns the iteration and
+    the coordinate time. The time is nan if neither line has it.
+    """
+    tokens = lines[0].split()
+    iteration = int(tokens[2])
+    if b'time' in tokens[3:]:
+        return iteration,float(tokens[tokens.index(b'time',3)+1])
+    if len(lines) > 1 and lines[1].startswith(TIME_HEADER):
+        tokens = lines[1].split()
+        if tokens[2] != b'level':
+            return iteration,float(tokens[2])
+    return iteration,float('nan')
+
+def is_cut_header(text):
+    """
+    Takes the text from an '# iteration' header to the end of a file
+    and returns True if the header was cut off partway through. That
+    happens while Cactus is still writing the file. The header is cut
+    if its line has no newline yet, or if the line after it is an
+    unfinished comment (like a half-written '# time' line).
+    """
+    lines = text.split(b'\n')
+    return len(lines) < 2 or (len(lines) == 2 and lines[1].startswith(b'#'))
+
+def scan_iteration_offsets(filename,last_iteration=None,last_time=None,
+                           first_byte=0):
+    """
+    Scans filename for the '# iteration' (and '# time') header lines
+    without parsing any data and returns a dictionary of three arrays:
+
+    iterations, the distinct iterations in the file, in file order;
+    times, the coordinate time of each of them;
+    offsets, the byte offset of the first header of each iteration,
+    plus the size of the file at the end. The bytes of the kth
+    snapshot are offsets[k]:offsets[k+1].
+
+    The file is read in big chunks and searched with bytes.find, so no
+    Python code runs per data line.
+
+    If last_iteration or last_time is given, the scan stops at the
+    first iteration after it. The last offset is then the start of
+    that iteration instead of the size of the file, so the index
+    covers everything up to last_iteration (or last_time).
+
+    If first_byte is given, the scan starts there. It must be at the
+    start of a line. Offsets are still from the start of the file.
+
+    A header cut off at the end of the file (see is_cut_header) isn't
+    parsed. The last offset is then the start of that header, as if
+    the scan had stopped there.
+    """
+    pattern = b'\n' + ITERATION_HEADER
+    iterations = []
+    times = []
+    offsets = []
+    stop = None
+    # Offsets into a compressed file are offsets into the decompressed
+    # text
+    chunks = compressed_files.read_chunks(filename,SCAN_CHUNK_SIZE,
+                                            first_byte)
+    try:
+        # Pretend the file starts right after a newline. base is the
+        # file offset of buffer[0].
+        buffer = b'\n'
+        base = first_byte - 1
+        while True:
+            chunk = next(chunks,b'')
+            buffer += chunk
+            start = 0
+            incomplete = False
+            while True:
+                k = buffer.find(pattern,start)
+                if k < 0:
+                    break
+                # We need the header line and the one after it
+                end = buffer.find(b'\n',k+1)
+                end = buffer.find(b'\n',end+1) if end >= 0 else end
+                if end < 0 and chunk:
+                    incomplete = True
+                    break
+                if end < 0 and is_cut_header(buffer[k+1:]):
+                    stop = base + k + 1
+                    break
+                lines = buffer[k+1:end if end >= 0 else None].split(b'\n')
+                iteration,time = parse_iteration_header(lines)
+                if (last_iteration is not None and iteration > last_iteration)\
+                        or (last_time is not None and time > last_time):
+                    stop = base + k + 1
+                    break
+                if not iterations or iteration != iterations[-1]:
+                    iterations.append(iteration)
+                    times.append(time)
+                    offsets.append(base + k + 1)
+                start = k + 1
+            if not chunk or stop is not None:
+                break
+            # Keep anything that might be the start of a header
+            cut = k if incomplete else max(start,len(buffer)-len(pattern)+1)
+            base += cut
+            buffer = buffer[cut:]
+        offsets.append(base + len(buffer) if stop is None else stop)
+    finally:
+        chunks.close()
+    return {'iterations' : np.array(iterations,dtype=np.int64),
+            'times' : np.array(times,dtype=float),
+            'offsets' : np.array(offsets,dtype=np.int64)}
+
+def get_iteration_offsets(filename,use_cache=USE_CACHE):
+    """
+    Returns the byte-offset index made by scan_iteration_offsets. The
+    index is saved next to the file (see ascii_cache.py) and reused
+    until the file changes.
+    """
+    filename = compressed_files.find_file(filename)
+    if use_cache:
+        index = ascii_cache.load_arrays(filename,OFFSET_INDEX_KIND)
+        if index is not None:
+            return index
+    index = scan_iteration_offsets(filename)
+    if use_cache:
+        ascii_cache.save_arrays(filename,OFFSET_INDEX_KIND,index)
+    return index
+
+def read_snapshot_bytes(filename,start,stop,duplicates=DUPLICATE_RULE,
+                        components=None,fields=None):
+    """
+    Seeks to byte start of filename, reads up to byte stop and parses
+    the rows in between into a Snapshot.
+    """
+    usecols,schema = prepare_schema(filename,components,fields,duplicates)
+    data = make_snapshots(parse_byte_range((filename,start,stop,usecols)),
+                          schema)
+    return deduplicate(data,duplicates)[0]
+
+def extract_snapshot(filename,index,duplicates=DUPLICATE_RULE,
+                     components=None,fields=None,use_cache=USE_CACHE):
+    """
+    Returns only the index-th snapshot in filename (the snapshot
+    index, not the iteration number). Uses the byte-offset index to
+    seek straight to it and parses just that one snapshot.
+
+    duplicates, components and fields are as in extract_data. If
+    use_cache is true, the byte-offset index is cached (see
+    get_iteration_offsets).
+    """
+    filename = compressed_files.find_file(filename)
+    reader = find_reader(filename)
+    if reader is not None:
+        return reader.extract_snapshot(filename,index,duplicates,
+                                       components,fields)
+    offsets = get_iteration_offsets(filename,use_cache)['offsets']
+    if len(offsets) == 1:
+        # No headers to index. Fall back on streaming the file.
+        snapshots = iterate_snapshots(filename,duplicates,components,fields)
+        for snapshot in islice(snapshots,index,None):
+            return snapshot
+        raise IndexError("{} has no snapshot {}".format(filename,index))
+    if index < 0:
+        index += len(offsets) - 1
+    if not 0 <= index < len(offsets) - 1:
+        raise IndexError("{} has no snapshot {}".format(filename,index))
+    return read_snapshot_bytes(filename,offsets[index],offsets[index+1],
+                               duplicates,components,fields)
+
+def extract_snapshot_at_iteration(filename,iteration,
+                                  duplicates=DUPLICATE_RULE,
+                                  components=None,fields=None,
+                                  use_cache=USE_CACHE):
+    """
+    Returns the snapshot in filename at the given iteration number
+    (not the snapshot index). Raises a ValueError if there's no such
+    iteration.
+    """
+    index = get_snapshot_index(filename,use_cache)
+    matches = np.flatnonzero(index['iterations'] == iteration)
+    if len(matches) == 0:
+        raise ValueError("{} has no iteration {}".format(filename,iteration))
+    return extract_snapshot(filename,matches[0],duplicates,components,fields,
+                            use_cache)
+
+def extract_snapshot_at_time(filename,time,duplicates=DUPLICATE_RULE,
+                             components=None,fields=None,
+                             tolerance=TIME_TOLERANCE,use_cache=USE_CACHE):
+    """
+    Returns the snapshot in filename at the given coordinate time,
+    give or take tolerance (see TimeIndex). Raises a ValueError if
+    there's no such time.
+    """
+    index = get_snapshot_index(filename,use_cache)
+    try:
+        snapshot = TimeIndex(index['times']).find_time(time,tolerance)
+    except ValueError:
+        raise ValueError("{} has no time {}".format(filename,time))
+    return extract_snapshot(filename,snapshot,duplicates,components,fields,
+                            use_cache)
+
+def get_snapshot_index(filename,use_cache=USE_CACHE):
+    """
+    Returns a dictionary with the iteration and time of every snapshot
+    in filename, under the keys 'iterations' and 'times'. Works for
+    every kind of file find_reader knows, too. For ASCII files, the
+    index is cached if use_cache is true (see get_iteration_offsets).
+    """
+    filename = compressed_files.find_file(filename)
+    reader = find_reader(filename)
+    if reader is not None:
+        return reader.get_iteration_index(filename)
+    return get_iteration_offsets(filename,use_cache)
+
+def find_reader(filename):
+    """
+    Returns the library that reads filename if it isn't Cactus ASCII
+    output, or None if it is. The libraries are carpet_hdf5, for
+    CarpetIOHDF5 output, and columnar_archive, for tables of archived
+    simulations. Each has its own extract_data, iterate_snapshots,
+    extract_snapshot and get_iteration_index.
+    """
+    if columnar_archive.is_table(filename):
+        return columnar_archive
+    if carpet_hdf5.is_hdf5(filename):
+        return carpet_hdf5
+    return None
 
 def extract_data_old(filename):
     """
@@ -174,14 +1825,68 @@ def extract_data_old(filename):
                       for iteration in get_iterations(data_string)]
     return iterations
 
-def get_lattice_spacing(data):
+def lattice_spacings(data,index=0):
     """
-    Extracts the grid spacing by measuring the 2-norm of the
-    difference between two points in a given snapshot at a given
-    time. The snapshot and time are assumed not to matter. This is
-    obviously a poor assumption for adaptive mesh refinement and will
-    need to be rethunk in more serious cases.
+    Takes a Snapshots store and returns (levels,spacings), the sorted
+    refinement levels in the index-th snapshot and the grid spacing on
+    each. The spacing is the distance between neighbouring points on
+    the same level, per step of the grid indices, so gaps and
+    duplicated ghost points don't matter. A level with a single point
+    has no spacing and isn't in levels.
     """
+    start,stop = data.row_range(index)
+    rl = data.columns['rl'][start:stop]
+    indices = np.array([data.columns[name][start:stop] \
+                            for name in INDEX_COLUMNS]).T
+    positions = np.array([data.columns[name][start:stop] \
+                              for name in POSITION_COLUMNS]).T
+    order = np.lexsort(list(indices.T) + [rl])
+    rl,indices,positions = rl[order],indices[order],positions[order]
+    steps = np.abs(np.diff(indices,axis=0)).max(axis=1) \
+        if len(rl) > 1 else np.zeros(0,dtype=int)
+    neighbours = (rl[1:] == rl[:-1]) & (steps > 0)
+    distances = norm(np.diff(positions,axis=0)[neighbours],axis=1)
+    ratios = distances/steps[neighbours]
+    on_level = rl[1:][neighbours]
+    if len(on_level) == 0:
+        return np.zeros(0,dtype=rl.dtype),np.zeros(0)
+    starts = np.flatnonzero(np.concatenate(([True],
+                                            on_level[1:] != on_level[:-1])))
+    return on_level[starts],np.minimum.reduceat(ratios,starts)
+
+def get_lattice_spacing(data,level=None):
+    """
+    Extracts the grid spacing on the given refinement level, or on the
+    coarsest level if level is None. The snapshot is assumed not to
+    matter, so we use the first one. data can be a Snapshots store,
+    a list of snapshots, or a list whose first element is a Snapshot
+    of a store. Raises a ValueError if the level has no spacing.
+
+    For stores, see lattice_spacings. For lists of lists, or stores
+    without the SPACING_FIELDS, we measure the 2-norm of the difference
+    between the first two points, which is only right without mesh
+    refinement.
+    """
+    index = 0
+    if not is_store(data) and len(data) > 0 and is_store_snapshot(data[0]):
+        data,index = data[0].store,data[0].index
+    if is_store(data) and all(name in data.columns \
+                                  for name in SPACING_FIELDS):
+        levels,spacings = lattice_spacings(data,index)
+        if level is None and len(levels) > 0:
+            return float(spacings[0])
+        if level is not None:
+            if level not in levels:
+                raise ValueError("No lattice spacing on "
+                                 +"refinement level {}.".format(level))
+            return float(spacings[np.flatnonzero(levels == level)[0]])
+    if is_store(data):
+        start = data.offsets[index]
+        position1 = np.array([data.columns[name][start] \
+                                  for name in POSITION_COLUMNS])
+        position2 = np.array([data.columns[name][start+1] \
+                                  for name in POSITION_COLUMNS])
+        return norm(position2 - position1)
     position1 = data[0][0][5]
     position2 = data[0][1][5]
     spacing = norm(position2 - position1)
@@ -192,19 +1897,62 @@ def tensor_element(i,j,tensor):
     tensor is a 6-element numpy array that represents a symmetric
     3x3 tensor.
 
-    tensor_element extracts the (i,j)th element of tensor.
+    tensor_element extracts the (i,j)th element of tensor. A wrapper
+    around tensor_elements.
+    """
+    return tensor_elements(i,j,tensor)
+
+def tensor_elements(i,j,tensors):
+    """
+    tensors is an (N,6) array of N symmetric tensors, one per row, or
+    a single 6-element tensor. Returns the (i,j)th element of each of
+    them in one indexed gather. For a two-dimensional array this is a
+    view.
+    """
+    return np.asarray(tensors)[...,tensor_index(i,j)]
+
+def snapshot_elements(i,j,snapshot):
+    """
+    Returns an array of the (i,j)th element of the tensor in every row
+    of snapshot. Works for a Snapshot or a list of rows.
+    """
+    if is_store_snapshot(snapshot):
+        return snapshot.elements(i,j)
+    return tensor_elements(i,j,np.array([line[-1] for line in snapshot]))
+
+def tensor_index(i,j):
+    """
+    Returns the index of the (i,j)th element of a symmetric tensor in
+    [Txx, Txy, Txz, Tyy, Tyz, Tzz]. This is the column of the data
+    block in a Snapshots store.
     """
     assert 0 <= i < 3 and 0 <= j < 3 and "We're working with a 3x3 tensor."
-    if i == 0:
-        return tensor[j]
-    elif i == 1 and j == 1:
-        return tensor[3]
-    elif i == 1 and j == 2:
-        return tensor[4]
-    elif i == 2 and j == 2:
-        return tensor[5]
+    return SYMMETRIC_TENSOR_INDEX[i,j]
+
+def data_index(schema,i=0,j=0):
+    """
+    Returns the column of the data block that holds the (i,j)th
+    element of the variable described by schema. Scalars ignore i and
+    j. Vectors and groups use i as the index and ignore j. Symmetric
+    tensors use tensor_index. Raises a ValueError if the store was
+    loaded without that component.
+    """
+    if schema.kind == SCALAR:
+        return 0
+    # The schema may only have some of the components (see
+    # project_schema), so we find them by name.
+    if schema.kind == SYMMETRIC_TENSOR:
+        suffixes,suffix = SYMMETRIC_TENSOR_SUFFIXES,tensor_index(i,j)
+    elif schema.kind == VECTOR:
+        suffixes,suffix = VECTOR_SUFFIXES,i
     else:
-        return tensor_element(j,i,tensor)
+        assert 0 <= i < len(schema.data_names) and "Index out of range."
+        return i
+    prefix = schema.data_names[0][:-len(suffixes[0])]
+    name = prefix + suffixes[suffix]
+    if name not in schema.data_names:
+        raise ValueError("Component {} was not loaded.".format(name))
+    return schema.data_names.index(name)
 
 def element_at_position_of_time(i,j,position,data):
     """
@@ -215,21 +1963,23 @@ def element_at_position_of_time(i,j,position,data):
     axis or or a one-dimensional line. So these will naturally be in
     order.
     """
-    times = []
-    elements = []
-    for iteration in data:
-        times.append(iteration[0][4])
-        elements.append(tensor_element(i,j,iteration[position][-1]))
-    times = np.array(times)
-    elements = np.array(elements)
-    return times,elements
+    if is_store(data):
+        starts = data.offsets[:-1]
+        stops = data.offsets[1:]
+        rows = starts + position if position >= 0 else stops + position
+        assert np.all((starts <= rows) & (rows < stops)) \
+            and "Position must exist in every snapshot."
+        return data.columns['time'][starts],data.elements(i,j)[rows]
+    times = np.array([iteration[0][4] for iteration in data])
+    tensors = np.array([iteration[position][-1] for iteration in data])
+    return times,tensor_elements(i,j,tensors)
 
 def element_at_position_of_time_from_file(i,j,position,filename):
     """
     Same as element at position of time, but extracts information from
-    a file.
+    a file. Only the (i,j)th component is loaded.
     """
-    data = extract_data(filename)
+    data = extract_data(filename,components=[(i,j)],fields=[])
     return element_at_position_of_time(i,j,position,data)
 
 
@@ -240,14 +1990,11 @@ def element_of_position_at_snapshot(i,j,coord,snapshot):
 
     coord gives the coordinate to examine. 0=x,1=y=2=z
     """
-    positions = []
-    elements = []
-    for line in snapshot:
-        positions.append(line[5][coord])
-        elements.append(tensor_element(i,j,line[-1]))
-    positions = np.array(positions)
-    elements = np.array(elements)
-    return positions,elements
+    if is_store_snapshot(snapshot):
+        positions = snapshot.column(POSITION_COLUMNS[coord]).copy()
+    else:
+        positions = np.array([line[5][coord] for line in snapshot])
+    return positions,snapshot_elements(i,j,snapshot)
 
 def element_of_position_at_time(i,j,coord,time,data):
     """
@@ -264,33 +2011,33 @@ def element_of_position_at_time(i,j,coord,time,data):
 def element_of_position_at_time_from_file(i,j,coord,time,filename):
     """
     Same as element_of_position_at_time but extracts information from
-    a file.
+    a file. Only the snapshot we need is parsed.
     """
-    data = extract_data(filename)
-    return element_of_position_at_time(i,j,coord,time,data)
+    snapshot = extract_snapshot(filename,time,components=[(i,j)],
+                                fields=[POSITION_COLUMNS[coord]])
+    return element_of_position_at_snapshot(i,j,coord,snapshot)
 
 
 def find_norm(i,j,snapshot,order):
     """
     Finds the order-norm of the (i,j)th component of a tensor.
     """
-    return np.norm([tensor_element(i,j,line[-1]) for line in snapshot],
-                   ord=order)
+    return norm(snapshot_elements(i,j,snapshot),ord=order)
 
 
 def find_norm_of_time(i,j,data,order=2):
     """
     Finds the order-norm of the (i,j)th component of a tensor as a
-    function of time.
+    function of time. Every snapshot is done at once with
+    segment_reductions.
     """
-    norms = []
-    times = []
-    for snapshot in data:
-        norm = find_norm(i,j,snapshot,order)
-        norms.append(norm)
-        times.append(snapshot[0][-3])
-    norms = np.array(norms)
-    times = np.array(times)
+    times,values,offsets = component_segments(i,j,data)
+    if order in ORDER_REDUCTIONS:
+        reduction = ORDER_REDUCTIONS[order]
+        norms = segment_reductions(values,offsets,[reduction])[reduction]
+    else:
+        assert order > 0 and "Only positive orders are supported."
+        norms = segment_sum(np.abs(values)**order,offsets)**(1.0/order)
     return norms,times
 
 
@@ -299,11 +2046,120 @@ def find_norm_of_time_from_file(i,j,filename,order=2):
     Finds the order-norm of the (i,j)th component of a tensor as a
     function of time.
 
-    Uses a file.
+    Uses a file. Only the (i,j)th component is loaded.
     """
-    data = extract_data(filename)
+    data = extract_data(filename,components=[(i,j)],fields=[])
     return find_norm_of_time(i,j,data,order)
 
 
+def component_segments(i,j,data):
+    """
+    Returns three arrays, times, values and offsets. values is the
+    (i,j)th element of the tensor in every row of data, snapshot
+    after snapshot. The rows of the kth snapshot are
+    values[offsets[k]:offsets[k+1]], and it happens at times[k].
+    """
+    if is_store(data):
+        return data.times(),data.elements(i,j),data.offsets
+    times = np.array([snapshot[0][4] for snapshot in data])
+    values = [snapshot_elements(i,j,snapshot) for snapshot in data]
+    offsets = np.concatenate(([0],np.cumsum([len(v) for v in values])))
+    return times,np.concatenate(values),offsets.astype(np.int64)
+
+
+def segment_sum(values,offsets):
+    """
+    Returns the sum of values[offsets[k]:offsets[k+1]] for every k.
+    """
+    if len(offsets) < 2:
+        return np.zeros(0)
+    return np.add.reduceat(values,offsets[:-1])
+
+
+def segment_reductions(values,offsets,reductions=REDUCTIONS,weights=None):
+    r"""
+    Reduces each segment values[offsets[k]:offsets[k+1]] of values to
+    one number, for every segment at once. For the rows of a Snapshots
+    store, the segments are the snapshots. Returns a dictionary that
+    maps the name of each reduction to an array with one entry per
+    segment. The reductions are
+
+    'L1'   = \sum_j |v_j| w_j
+    'L2'   = sqrt(\sum_j |v_j|^2 w_j)
+    'Linf' = max_j |v_j|
+    'min', 'max'
+    'mean' = \sum_j v_j w_j / \sum_j w_j
+
+    weights w can be a number (like the lattice spacing h, which
+    makes 'L2' the norm2 error of make_norm2_error), one number per
+    segment, or one number per value. By default every weight is 1.
+
+    Every segment must have at least one value. The absolute values
+    and squares are computed once and shared by all the reductions.
+    """
+    values = np.asarray(values,dtype=float)
+    offsets = np.asarray(offsets)
+    starts = offsets[:-1]
+    lengths = np.diff(offsets)
+    if np.any(lengths <= 0):
+        raise ValueError("Every segment needs at least one value.")
+    for name in reductions:
+        if name not in REDUCTIONS:
+            raise ValueError("Unknown reduction {}.".format(name))
+    if len(starts) == 0:
+        return {name : np.zeros(0) for name in reductions}
+    if weights is None:
+        weights = 1.0
+    weights = np.asarray(weights,dtype=float)
+    if weights.ndim == 1 and len(weights) == len(starts) != len(values):
+        weights = np.repeat(weights,lengths)
+    magnitudes = None
+    if 'L1' in reductions or 'Linf' in reductions:
+        magnitudes = np.abs(values)
+    results = {}
+    for name in reductions:
+        if name == 'L1':
+            results[name] = np.add.reduceat(magnitudes*weights,starts)
+        elif name == 'L2':
+            results[name] = np.sqrt(np.add.reduceat(values*values*weights,
+                                                    starts))
+        elif name == 'Linf':
+            results[name] = np.maximum.reduceat(magnitudes,starts)
+        elif name == 'min':
+            results[name] = np.minimum.reduceat(values,starts)
+        elif name == 'max':
+            results[name] = np.maximum.reduceat(values,starts)
+        elif name == 'mean':
+            if weights.ndim == 0:
+                results[name] = np.add.reduceat(values,starts)/lengths
+            else:
+                results[name] = np.add.reduceat(values*weights,starts)\
+                    /np.add.reduceat(weights,starts)
+    return results
+
+
+def reductions_of_time(i,j,data,reductions=REDUCTIONS,weights=None):
+    """
+    Reduces the (i,j)th component of a tensor in every snapshot of
+    data. Returns times and a dictionary of reductions, as returned
+    by segment_reductions.
+
+    To weight by the lattice spacing, as in make_norm2_error, pass
+    weights=get_lattice_spacing(data).
+    """
+    times,values,offsets = component_segments(i,j,data)
+    return times,segment_reductions(values,offsets,reductions,weights)
+
+
+def reductions_of_time_from_file(i,j,filename,reductions=REDUCTIONS,
+                                 weights=None):
+    """
+    Same as reductions_of_time, but extracts information from a
+    file. Only the (i,j)th component is loaded.
+    """
+    data = extract_data(filename,components=[(i,j)],fields=[])
+    return reductions_of_time(i,j,data,reductions,weights)
+
+
 if __name__=="__main__":
     raise ImportWarning(WARNING_MESSAGE)
@@ -6,6 +6,11 @@ Time-stamp: <2014-03-13 12:23:17 (jonah)>
 This little library extends extract_tensor_data.py to be multipatch aware.
 
 It uses both the grid::coordinates files and the data files
+
+extract_physical_data reads a data file and its grid::coordinates
+file and joins them into one Snapshots store whose positions are the
+physical coordinates. The functions of extract_tensor_data.py then
+work on it directly, without coordinate maps.
 """
 
 # Imports
@@ -14,25 +19,165 @@ import numpy as np
 import extract_tensor_data as etd
 import extract_coordinates_data as ecd
 import simfactory_interface as interface
+import parallel_loading # To read both files at once
 # ----------------------------------------------------------------------
 
 # some simple wrappers
 extract_data = etd.extract_data
 make_coordinate_maps = ecd.make_coordinate_maps
+time_window = etd.time_window
 WARNING_MESSAGE = etd.WARNING_MESSAGE
+# How sort_positions treats a position that appears more than once in
+# a snapshot: keep the 'first' element, 'average' the elements, or
+# raise an 'error'.
+DUPLICATE_POSITION_RULES = ['first','average','error']
+DUPLICATE_POSITION_RULE = 'first'
+# The columns we join the data and the coordinates on
+JOIN_COLUMNS = etd.INDEX_COLUMNS
+# The largest key join_keys can make
+MAX_KEY = np.iinfo(np.int64).max
+
+def load_file(arguments):
+    """
+    Takes a tuple (filename,iterations,times) and returns
+    etd.extract_data(filename,iterations=iterations,times=times).
+
+    This is what the workers in extract_physical_data run.
+    """
+    filename,iterations,times = arguments
+    return etd.extract_data(filename,iterations=iterations,times=times)
+
+def join_keys(stores):
+    """
+    Takes a list of Snapshots stores and returns one array of int64
+    keys per store. Two rows have the same key if and only if they
+    have the same iteration and grid indices.
+    """
+    iterations = np.unique(np.concatenate([store.columns['it'] \
+                                               for store in stores]))
+    keys = [np.searchsorted(iterations,store.columns['it']).astype(np.int64) \
+                for store in stores]
+    size = len(iterations)
+    for name in JOIN_COLUMNS:
+        low = min([int(store.columns[name].min()) for store in stores \
+                       if len(store.columns[name]) > 0] or [0])
+        high = max([int(store.columns[name].max()) for store in stores \
+                        if len(store.columns[name]) > 0] or [0])
+        span = high - low + 1
+        size *= span
+        if size > MAX_KEY:
+            raise ValueError("The grid is too big to join on.")
+        keys = [key*span + (store.columns[name] - low) \
+                    for key,store in zip(keys,stores)]
+    return keys
+
+def join_coordinates(data,coordinates):
+    """
+    Takes a Snapshots store of tensor data and one of the matching
+    grid::coordinates file, and returns a new store of the tensor
+    data whose positions are the physical coordinates. The rows are
+    matched on iteration and grid indices, with one sorted merge over
+    every snapshot at once. The rows of each snapshot are sorted by
+    physical position, z slowest and x fastest.
+
+    Raises a ValueError if a row of data has no coordinates.
+    """
+    keys,coordinate_keys = join_keys([data,coordinates])
+    order = np.argsort(coordinate_keys,kind='mergesort')
+    sorted_keys = coordinate_keys[order]
+    found = np.minimum(np.searchsorted(sorted_keys,keys),
+                       max(len(sorted_keys)-1,0))
+    if len(keys) > 0 and (len(sorted_keys) == 0 \
+                              or np.any(sorted_keys[found] != keys)):
+        raise ValueError("Some of the data has no coordinates.")
+    # The data columns of the coordinates are [true_x,true_y,true_z,r]
+    physical = coordinates.data[order[found]]
+    columns = dict(data.columns)
+    for axis,name in enumerate(etd.POSITION_COLUMNS):
+        columns[name] = np.array(physical[:,axis])
+    joined = etd.Snapshots(columns,data.data,data.iterations,data.offsets,
+                           data.schema)
+    order = np.lexsort([columns[name] for name in etd.POSITION_COLUMNS] \
+                           + [joined.snapshot_numbers()])
+    return joined.select_rows(order)
+
+def extract_physical_data(filename,coordinates_filename,iterations=None,
+                          times=None,workers=1):
+    """
+    Reads the tensor data in filename and the grid::coordinates file
+    coordinates_filename and joins them with join_coordinates. With
+    workers > 1 the two files are read at the same time, by separate
+    processes (see parallel_loading.py). That costs a fork and
+    pickling both stores back, so it only pays off for big files.
+
+    iterations and times pick out the snapshots we want, as in
+    etd.extract_data.
+    """
+    data,coordinates = parallel_loading.load_all(load_file,
+                                                 [(filename,iterations,times),
+                                                  (coordinates_filename,
+                                                   iterations,times)],
+                                                 workers)
+    return join_coordinates(data,coordinates)
 
-def sort_list_pair(list1,list2):
+def sort_positions(positions,elements,offsets=None,
+                   duplicates=DUPLICATE_POSITION_RULE):
+    """
+    Sorts the positions of every snapshot, and the elements with
+    them, with one lexsort over all the snapshots at once. The
+    positions and elements of snapshot k are
+    positions[offsets[k]:offsets[k+1]], as in component_segments in
+    extract_tensor_data.py. offsets defaults to a single snapshot.
+
+    duplicates is one of DUPLICATE_POSITION_RULES and decides what
+    happens to a position that appears more than once in a snapshot.
+
+    Returns the sorted positions, elements and offsets.
+    """
+    assert duplicates in DUPLICATE_POSITION_RULES \
+        and "Unknown rule for duplicate positions."
+    positions = np.asarray(positions,dtype=float)
+    elements = np.asarray(elements)
+    if offsets is None:
+        offsets = [0,len(positions)]
+    offsets = np.asarray(offsets,dtype=np.int64)
+    snapshots = np.repeat(np.arange(len(offsets)-1),np.diff(offsets))
+    # lexsort is stable, so the first copy of a position stays first
+    order = np.lexsort([positions,snapshots])
+    positions = positions[order]
+    elements = elements[order]
+    snapshots = snapshots[order]
+    repeated = (positions[1:] == positions[:-1]) \
+        & (snapshots[1:] == snapshots[:-1])
+    if np.any(repeated):
+        if duplicates == 'error':
+            raise ValueError("Position {} appears more than once."\
+                                 .format(positions[1:][repeated][0]))
+        starts = np.flatnonzero(np.concatenate(([True],~repeated)))
+        if duplicates == 'average':
+            counts = np.diff(np.concatenate((starts,[len(positions)])))
+            elements = np.add.reduceat(elements,starts)/counts.astype(float)
+        else:
+            elements = elements[starts]
+        positions = positions[starts]
+        snapshots = snapshots[starts]
+    offsets = np.searchsorted(snapshots,np.arange(len(offsets)))
+    return positions,elements,offsets.astype(np.int64)
+
+def sort_list_pair(list1,list2,duplicates=DUPLICATE_POSITION_RULE):
     """
     Sometimes two lists are coupled: the ith element of list1
     corresponds to the ith element of list2. Thus, if we want to sort
     list1, we must rearrange list2 so that it still matches list1.
+
+    duplicates is as in sort_positions.
     """
-    list2D = {list1[i] : list2[i] for i in range(len(list1))}
-    list1.sort()
-    list2 = [list2D[i] for i in list1]
-    return list1,list2
-    
-def element_of_position_at_snapshot(i,j,coord,snapshot,maps,time_index):
+    list1,list2,offsets = sort_positions(list1,list2,duplicates=duplicates)
+    return list1.tolist(),list2.tolist()
+
+
+def element_of_position_at_snapshot(i,j,coord,snapshot,maps,time_index,
+                                    duplicates=DUPLICATE_POSITION_RULE):
     """
     Returns two lists, position in the spacetime and the (i,j)th
     element of the tensor in the snapshot at that position.
@@ -41,21 +186,23 @@ def element_of_position_at_snapshot(i,j,coord,snapshot,maps,time_index):
 
     Uses maps extracted from ecd.make_coordinate_maps
 
-    time_index is the index of the snapshot.
+    time_index is the index of the snapshot. duplicates is as in
+    sort_positions.
     """
-    positions = []
-    elements = []
-    for line in snapshot:
-        positions.append(maps[time_index][coord][line[3][coord]])
-        elements.append(etd.tensor_element(i,j,line[-1]))
+    if etd.is_store_snapshot(snapshot):
+        indices = snapshot.column(etd.INDEX_COLUMNS[coord])
+    else:
+        indices = np.array([line[3][coord] for line in snapshot],dtype=int)
+    # One gather maps every row to its physical position
+    positions = maps[time_index][coord][indices]
+    elements = etd.snapshot_elements(i,j,snapshot)
     # positions and elements may not be sorted
-    positions,elements = sort_list_pair(positions,elements)
-    # Put them in numpy arrays for speed
-    positions = np.array(positions)
-    elements = np.array(elements)
+    positions,elements,offsets = sort_positions(positions,elements,
+                                                duplicates=duplicates)
     return positions,elements
 
-def element_of_position_at_time(i,j,coord,time,data,maps):
+def element_of_position_at_time(i,j,coord,time,data,maps,
+                                duplicates=DUPLICATE_POSITION_RULE):
     """
     Returns two lists, position in the spacetime, and the (i,j)th
     element of the tensor in dataset data at that position. Both are
@@ -64,9 +211,35 @@ def element_of_position_at_time(i,j,coord,time,data,maps):
 
     coord gives the coordinate to examine. 0=x,1=y=2=z
 
-    Uses maps extracted from ecd.make_coordinate_maps
+    Uses maps extracted from ecd.make_coordinate_maps. duplicates is
+    as in sort_positions.
+    """
+    return element_of_position_at_snapshot(i,j,coord,data[time],maps,time,
+                                           duplicates)
+
+def element_of_physical_position_at_time(i,j,coord,time,data,
+                                         duplicates=DUPLICATE_POSITION_RULE):
+    """
+    Like element_of_position_at_time, but for a store made by
+    extract_physical_data, so no maps are needed.
+    """
+    positions,elements = etd.element_of_position_at_time(i,j,coord,time,data)
+    positions,elements,offsets = sort_positions(positions,elements,
+                                                duplicates=duplicates)
+    return positions,elements
+
+def element_of_physical_position_of_time(i,j,coord,data,
+                                         duplicates=DUPLICATE_POSITION_RULE):
+    """
+    Does element_of_physical_position_at_time for every snapshot of
+    data at once. Returns a parallel_loading.Evolution, whose
+    positions and elements are sorted within each snapshot.
     """
-    return element_of_position_at_snapshot(i,j,coord,data[time],maps,time)
+    times,elements,offsets = etd.component_segments(i,j,data)
+    positions = data.columns[etd.POSITION_COLUMNS[coord]]
+    positions,elements,offsets = sort_positions(positions,elements,offsets,
+                                                duplicates)
+    return parallel_loading.Evolution(times,offsets,positions,elements)
 
 
 if __name__=="__main__":
@@ -17,6 +17,16 @@ python2 find_crash_point.py *curv.x.asc
 and output would look like
 
 gaugewave.curv.x.asc 10 static_tov.curv.x.asc 3.63
+
+To watch simulations that are still running, use --follow:
+
+python2 find_crash_point.py --follow *curv.x.asc
+
+Every POLL_INTERVAL seconds only the output written since the last
+check is read, and the latest good time of each file is printed. A
+file that hasn't grown since the last check is taken to be finished,
+so its last iteration is read too. It stops when every simulation
+has crashed or finished.
 """
 
 # Imports
@@ -24,6 +34,14 @@ gaugewave.curv.x.asc 10 static_tov.curv.x.asc 3.63
 import numpy as np # for nan and arrays
 import extract_tensor_data as etd # to deal with tensor ascii files
 import sys # For globbing
+import os # For file sizes
+import time as clock # For sleeping between checks
+# ----------------------------------------------------------------------
+
+# Global constants
+# ----------------------------------------------------------------------
+FOLLOW_FLAG = '--follow'
+POLL_INTERVAL = 60 # Seconds between checks in follow mode
 # ----------------------------------------------------------------------
 
 def abs_max(tensor):
@@ -37,13 +55,15 @@ def bad_tensor(tensor):
     Returns true if the tensor has diverged in any component.
     """
     t_max = abs_max(tensor)
-    return t_max == np.nan or t_max == np.inf
+    return not np.isfinite(t_max)
 
 def bad_snapshot(snapshot):
     """
     Returns true if a snapshot as defined in extract_tensor_data.py
     contains a bad tensor.
     """
+    if etd.is_store_snapshot(snapshot):
+        return bad_tensor(snapshot.data())
     for row in snapshot:
         tensor = row[-1]
         if bad_tensor(tensor):
@@ -60,17 +80,56 @@ def main(filename):
     """
     Takes a filename and finds the time right before the system
     crashed.
+
+    The file is streamed one snapshot at a time, so it can be much
+    bigger than memory.
     """
-    data = etd.extract_data(filename)
+    time = None
+    for snapshot in etd.iterate_snapshots(filename):
+        if bad_snapshot(snapshot):
+            break
+        time = snapshot[0][4]
+    print "{} {}".format(filename,time)
+    return
 
-    for iteration in range(len(data)):
-        if bad_snapshot(data[iteration]):
-            print "{} {}".format(filename,get_time(data,iteration-1))
+def follow(filename_list,interval=POLL_INTERVAL):
+    """
+    Takes a list of files that are still being written and watches
+    them until every simulation has crashed or finished. Each check
+    only reads the snapshots written since the last one. A file that
+    hasn't grown since the last check is finished, so its last
+    iteration is read as well and it isn't checked again.
+    """
+    followers = [etd.Follower(filename) for filename in filename_list]
+    times = [None]*len(followers)
+    sizes = [None]*len(followers)
+    done = [False]*len(followers)
+    while True:
+        for i in range(len(followers)):
+            if done[i]:
+                continue
+            size = os.path.getsize(filename_list[i])
+            final = size == sizes[i]
+            sizes[i] = size
+            new_snapshots = followers[i].update(final)
+            if final:
+                done[i] = True
+            if new_snapshots is None:
+                continue
+            for snapshot in new_snapshots:
+                if bad_snapshot(snapshot):
+                    done[i] = True
+                    break
+                times[i] = snapshot[0][4]
+            print "{} {}".format(filename_list[i],times[i])
+        if all(done):
             return
-    print "{} {}".format(filename, get_time(data,len(data)-1))
-    return
+        clock.sleep(interval)
 
 if __name__ == "__main__":
-    for filename in sys.argv[1:]:
-        main(filename)
+    if sys.argv[1:2] == [FOLLOW_FLAG]:
+        follow(sys.argv[2:])
+    else:
+        for filename in sys.argv[1:]:
+            main(filename)
     
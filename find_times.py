@@ -22,6 +22,7 @@ import numpy as np # For array support and fast file-reading
 import re          # Regular expressions
 import os          # Operating system interface
 import simfactory_interface as interface
+import compressed_files # For archived (compressed) output
 # ----------------------------------------------------------------------
 
 # Global constants
@@ -61,8 +62,27 @@ def get_time_data(directory_name):
     """
     Given a directory name, extracts data from any one of the scalar
     output files and from it extracts timing information.
+
+    Every restart of the simulation is used. The times repeated after
+    recovering from a checkpoint are only counted once (see
+    interface.drop_overlaps).
+    """
+    tables = [get_time_data_of_restart(directory_name,restart_number) \
+                  for restart_number \
+                  in interface.get_restart_numbers(directory_name)]
+    if not tables:
+        raise IOError("There are no restarts in directory\n\t"+directory_name)
+    masks = interface.drop_overlaps([table[0] for table in tables])
+    return np.concatenate([table[1][mask] \
+                               for table,mask in zip(tables,masks)])
+
+def get_time_data_of_restart(directory_name,restart_number=RESTART_NUMBER):
     """
-    data_directory=interface.get_data_directory(directory_name,RESTART_NUMBER)
+    Same as get_time_data, but only for one restart. Returns the
+    iterations and the times.
+    """
+    data_directory=interface.get_data_directory(directory_name,restart_number)
+    matching_string = None
     for filename in os.listdir(data_directory):
         matches = [regex.match(filename) for regex in ALLOWED_FILE_REGEXES]
         # If nothing matches, evaluates to None. Otherwise evaluates
@@ -74,10 +94,11 @@ def get_time_data(directory_name):
     if not matching_string: # Then there were no matches at all
         raise IOError("There are no 1d files to open in directory\n\t"+directory_name)
     filepath = data_directory.rstrip('/') + '/' + matching_string.group(0)
-    data = np.loadtxt(filepath).transpose()
+    with compressed_files.open_file(filepath) as f:
+        data = np.loadtxt(f).transpose()
     iterations = data[0]
     times = data[1]
-    return times
+    return iterations,times
 
 def get_time_dictionary(list_of_directories):
     """
@@ -0,0 +1,160 @@
+"""
+parallel_loading.py
+
+A convergence study loads one simulation per resolution, and loading
+them one after another takes as long as all of the loads put
+together. This little library loads them at the same time, each in its
+own worker process.
+----------------------------------------------------------------------
+
+load_all(function,arguments_list) is like map(function,arguments_list),
+but each call runs in a pool of worker processes. function has to be
+defined at the top level of a module, so the workers can find it, and
+it takes a single argument. Results come back in the same order as
+arguments_list.
+
+The number of workers is the smallest of
+--- the number of workers asked for (by default, one per CPU),
+--- the number of jobs, and
+--- the number of jobs that fit in memory at once.
+For the last one, the caller can pass an estimate of how many bytes a
+single job needs (estimated_memory gives one for a file that is loaded
+whole). We only let the workers use MEMORY_FRACTION of the memory that
+is available when the pool starts. Without an estimate there is no
+memory cap.
+
+Everything a worker returns is pickled and sent back to the parent, so
+workers should return a few big numpy arrays, not long lists of little
+ones. An evolution (a list of snapshots [time,positions,elements]) is
+packed into an Evolution for the trip with pack_evolution, and
+unpacked again with unpack_evolution.
+
+To go the other way, and hand one big dataset to many workers without
+copying it, see shared_snapshots.py.
+"""
+
+# Imports
+# ----------------------------------------------------------------------
+import os # File system tools
+import numpy as np # For arrays
+from collections import namedtuple
+import multiprocessing # For the worker processes
+import compressed_files # To find and size compressed files
+# ----------------------------------------------------------------------
+
+# Global constants
+# ----------------------------------------------------------------------
+# The number of worker processes. None means one per CPU.
+LOAD_WORKERS = None
+# The fraction of the available memory the workers may use between them
+MEMORY_FRACTION = 0.5
+# Roughly how many bytes of memory loading a file takes per byte of
+# (uncompressed) text. The parse needs the text and the columns.
+MEMORY_PER_BYTE = 2
+# Rough size of uncompressed text per byte of compressed file
+COMPRESSION_RATIO = 5
+MEMINFO = '/proc/meminfo'
+MEMORY_AVAILABLE_KEY = 'MemAvailable:'
+# A packed list of snapshots [time,positions,elements]. The positions
+# and elements of snapshot k are positions[offsets[k]:offsets[k+1]]
+# and elements[offsets[k]:offsets[k+1]].
+Evolution = namedtuple('Evolution',['times','offsets','positions','elements'])
+WARNING_MESSAGE = "This is a library. You are only supposed to import it!"
+# ----------------------------------------------------------------------
+
+def available_memory():
+    """
+    Returns the number of bytes of memory available for new processes,
+    or None if we can't tell.
+    """
+    try:
+        with open(MEMINFO,'r') as f:
+            for line in f:
+                if line.startswith(MEMORY_AVAILABLE_KEY):
+                    return int(line.split()[1])*1024
+    except (IOError,OSError,ValueError,IndexError):
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES')*os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError,ValueError,OSError):
+        return None
+
+def estimated_memory(filename):
+    """
+    Estimates how many bytes of memory loading all of filename takes.
+    """
+    filename = compressed_files.find_file(filename)
+    size = os.path.getsize(filename)
+    if compressed_files.is_compressed(filename):
+        size *= COMPRESSION_RATIO
+    return size*MEMORY_PER_BYTE
+
+def count_workers(num_jobs,workers=LOAD_WORKERS,job_memory=None):
+    """
+    Returns the number of worker processes to use for num_jobs
+    jobs. workers is the most we want. job_memory is the number of
+    bytes one job needs, or None if we don't know. (It can also be a
+    list, one estimate per job. Then we plan for the biggest.)
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    workers = min(workers,num_jobs)
+    if job_memory is not None:
+        if not np.isscalar(job_memory):
+            job_memory = max(job_memory) if len(job_memory) > 0 else 0
+        memory = available_memory()
+        if memory is not None and job_memory > 0:
+            workers = min(workers,int(MEMORY_FRACTION*memory//job_memory))
+    return max(workers,1)
+
+def load_all(function,arguments_list,workers=LOAD_WORKERS,job_memory=None):
+    """
+    Returns [function(arguments) for arguments in arguments_list],
+    with the calls spread over a pool of worker processes. See
+    count_workers for workers and job_memory. Called from inside a
+    worker, it makes the calls one after another.
+    """
+    arguments_list = list(arguments_list)
+    workers = count_workers(len(arguments_list),workers,job_memory)
+    # The workers of a pool can't start pools of their own
+    if workers == 1 or multiprocessing.current_process().daemon:
+        return [function(arguments) for arguments in arguments_list]
+    pool = multiprocessing.Pool(workers)
+    try:
+        return pool.map(function,arguments_list,chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+def pack_evolution(snapshots):
+    """
+    Packs a list of snapshots [time,positions,elements] into an
+    Evolution.
+    """
+    times = np.array([snapshot[0] for snapshot in snapshots],dtype=float)
+    lengths = [len(snapshot[1]) for snapshot in snapshots]
+    offsets = np.zeros(len(snapshots)+1,dtype=int)
+    offsets[1:] = np.cumsum(lengths)
+    if snapshots:
+        positions = np.concatenate([snapshot[1] for snapshot in snapshots])
+        elements = np.concatenate([snapshot[2] for snapshot in snapshots])
+    else:
+        positions = np.zeros(0)
+        elements = np.zeros(0)
+    return Evolution(times,offsets,positions,elements)
+
+def unpack_evolution(evolution):
+    """
+    The opposite of pack_evolution. Returns a list of snapshots
+    [time,positions,elements]. positions and elements are views into
+    the arrays of evolution, so nothing is copied.
+    """
+    offsets = evolution.offsets
+    return [[evolution.times[k],
+             evolution.positions[offsets[k]:offsets[k+1]],
+             evolution.elements[offsets[k]:offsets[k+1]]] \
+                for k in range(len(evolution.times))]
+
+
+if __name__=="__main__":
+    raise ImportWarning(WARNING_MESSAGE)
@@ -17,6 +17,7 @@ is the component we care about.
 import numpy as np # For array support
 from scipy.optimize import curve_fit
 import extract_tensor_data as etd # For tensor support
+import parallel_loading # To load many files at once
 # Plot tools
 import matplotlib as mpl
 import matplotlib.pyplot as plt
@@ -29,6 +30,7 @@ D = 1 # The period of the wave.
 A = 0.5 # The amplitude of the wave.
 COORD = 0 # The x coordinate
 E_INDEX=(0,0) # The xx component of the extrinsic curvature tensor
+LEVELS = etd.FINEST # The finest data available at every point
 RESOLUTION = 200 # Resolution for plot_kxx or plot_gxx
 my_linewidth = 5
 fontsize = 20
@@ -43,7 +45,7 @@ DEBUGGING = False
 # ----------------------------------------------------------------------
 
 
-def get_Txx_data(time,filename_list):
+def get_Txx_data(time,filename_list,workers=parallel_loading.LOAD_WORKERS):
     """
     Takes a list of filenames (strings) and generates three lists,
     positions_list, Txx_list, time_index_list. positions_list contains
@@ -51,30 +53,47 @@ def get_Txx_data(time,filename_list):
     contains data the xx-element of the symmetric tensor we wish to
     investigate for each file.
 
-    time_index_list defines the time iteration at which the data is
-    extracted.
+    time_index_list holds the iteration (the Cactus iteration number)
+    at which the data is extracted. Only that one snapshot is read.
 
     Also returns lattice spacing, which is the spacing between
     points. We call the lattice spacing h. Returns a list, h for every
     file.
+
+    The files are read at the same time by up to workers processes
+    (see parallel_loading.py). Since only one snapshot is read, there
+    is no memory cap.
     """
-    positions_list = []
-    Txx_list = []
-    time_index_list = []
-    h_list = []
-    for filename in filename_list:
-        data = etd.extract_data(filename)
-        times = [snapshot[0][4] for snapshot in data]
-        # time_index = etd.find_largest_index_of_subvalue(times,time)
-        time_index = times.index(time) # Raises error if times are not exact
-        position,Txx=etd.element_of_position_at_time(E_INDEX[0], E_INDEX[1],
-                                                     COORD, time_index, data)
-        time_index_list.append(time_index)
-        positions_list.append(position)
-        Txx_list.append(Txx)
-        h_list.append(etd.get_lattice_spacing(data))
+    results = parallel_loading.load_all(load_Txx_at_time,
+                                        [(filename,time) \
+                                             for filename in filename_list],
+                                        workers)
+    positions_list = [result[0] for result in results]
+    Txx_list = [result[1] for result in results]
+    time_index_list = [result[2] for result in results]
+    h_list = [result[3] for result in results]
     return positions_list,Txx_list,time_index_list,h_list
 
+def load_Txx_at_time(arguments):
+    """
+    Takes a pair (filename,time) and returns the position, Txx,
+    iteration and lattice spacing for that file, as in get_Txx_data.
+
+    This is what the workers in get_Txx_data run.
+    """
+    filename,time = arguments
+    # We only need one component and the positions at one time
+    data = etd.extract_data(filename,components=[E_INDEX],
+                            fields=etd.SPACING_FIELDS,
+                            times=etd.time_window(time),
+                            levels=LEVELS)
+    snapshot_index = data.find_time(time) # Raises error if time is missing
+    time_index = data.iterations[snapshot_index]
+    position,Txx=etd.element_of_position_at_time(E_INDEX[0], E_INDEX[1],
+                                                 COORD, snapshot_index,
+                                                 data)
+    return position,Txx,time_index,etd.get_lattice_spacing(data)
+
 
 def get_xy_pair(function,xmin,xmax,time):
     """
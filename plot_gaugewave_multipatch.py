@@ -24,6 +24,7 @@ import matplotlib.pyplot as plt
 # Import other pieces of the toolbox
 import extract_tensor_data_multipatch as multipatch # For tensor
 import simfactory_interface as interface # for simfactory support
+import parallel_loading # To load many simulations at once
 # support We can still use the original plot gaugewave for a lot of
 # stuff, so let's import that.
 import plot_gaugewave as pg_original
@@ -58,13 +59,17 @@ SCALE_ERRORS=True
 
 def generate_map_resolution_and_tensor_data(directory_name,
                                             restart_number=RESTART_NUMBER,
-                                            file_name=False):
+                                            file_name=False,
+                                            times=None):
     """
     Takes a directory name and returns map data, tensor data, and
     resolution data.
 
     File name is the name of the file containing the tensor data. By
     default it is the metric tensor.
+
+    times is a window of coordinate times, as in etd.extract_data. If
+    it's given, only the snapshots in the window are read.
     """
     # File path stuff
     paths = interface.get_file_paths(directory_name,restart_number,file_name)
@@ -73,8 +78,38 @@ def generate_map_resolution_and_tensor_data(directory_name,
     coordinates_path = paths[2]
     parameter_path = paths[3]
     # Extract the data
-    tensor_data = multipatch.extract_data(tensor_path)
-    coordinate_maps = multipatch.make_coordinate_maps(coordinates_path)
+    tensor_data = multipatch.extract_data(tensor_path,times=times)
+    coordinate_maps = multipatch.make_coordinate_maps(coordinates_path,
+                                                      times=times)
+    resolution,number_of_cells = get_resolution(parameter_path)
+    return tensor_data,coordinate_maps,resolution,number_of_cells
+
+def generate_resolution_and_physical_data(directory_name,
+                                          restart_number=RESTART_NUMBER,
+                                          file_name=False,
+                                          times=None,workers=1):
+    """
+    Like generate_map_resolution_and_tensor_data, but returns the
+    tensor data already joined with the coordinates (see
+    multipatch.extract_physical_data), the resolution and the number
+    of cells. The two files are read by up to workers processes.
+    """
+    paths = interface.get_file_paths(directory_name,restart_number,file_name)
+    tensor_path = paths[1]
+    coordinates_path = paths[2]
+    parameter_path = paths[3]
+    tensor_data = multipatch.extract_physical_data(tensor_path,
+                                                   coordinates_path,
+                                                   times=times,
+                                                   workers=workers)
+    resolution,number_of_cells = get_resolution(parameter_path)
+    return tensor_data,resolution,number_of_cells
+
+def get_resolution(parameter_path):
+    """
+    Reads the number of cells from the parameter file and returns the
+    resolution and the number of cells.
+    """
     number_of_cells = interface.extract_parameter_value(parameter_path,
                                                         RESOLUTION_PARAMETER_STRING,
                                                         True)
@@ -84,9 +119,10 @@ def generate_map_resolution_and_tensor_data(directory_name,
     if DEBUGGING:
         print "num cells = {}".format(number_of_cells)
         print "h = {}".format(resolution)
-    return tensor_data,coordinate_maps,resolution,number_of_cells
+    return resolution,number_of_cells
 
-def get_Txx_data(time,directory_list,file_name=False):
+def get_Txx_data(time,directory_list,file_name=False,
+                 workers=parallel_loading.LOAD_WORKERS):
     """
     Takes a list of directories (strings) and generates five lists,
     positions_list, Txx_list, time_index_list, h_list, and
@@ -94,8 +130,8 @@ def get_Txx_data(time,directory_list,file_name=False):
     in extract_tensor_data.py. Txx_list contains position data for the
     xx-component of the metric tensor.
 
-    time_index_list defines the time iteration at which the data is
-    extracted.
+    time_index_list holds the iteration (the Cactus iteration number)
+    at which the data is extracted. Only that one snapshot is read.
 
     Also returns lattice spacing, which is the spacing between
     points. We call the lattice spacing h. Returns a single value of h
@@ -106,31 +142,44 @@ def get_Txx_data(time,directory_list,file_name=False):
 
     n_cells_list provides the number of cells. in a parameter.
 
+    The directories are read at the same time by up to workers
+    processes (see parallel_loading.py).
+
     This method is adapted for multipatch.
     """
-    time = float('%.10f' % time)
-    positions_list = []
-    Txx_list = []
-    time_index_list = []
-    h_list = []
-    num_cells_list = []
-    for directory in directory_list:
-        tensor_data,coordinate_maps,h,num_cells = generate_map_resolution_and_tensor_data(directory,
-                                                                                RESTART_NUMBER,
-                                                                                file_name)
-        times = [float('%.10f' % snapshot[0][4]) for snapshot in tensor_data]
-        time_index = times.index(time) # Raises an error if the appropriate time doesn't exist
-        position,Txx=multipatch.element_of_position_at_time(E_INDEX[0],E_INDEX[1],COORD,
-                                                            time_index,
-                                                            tensor_data,
-                                                            coordinate_maps)
-        time_index_list.append(time_index)
-        positions_list.append(position)
-        Txx_list.append(Txx)
-        h_list.append(h)
-        num_cells_list.append(num_cells)
+    results = parallel_loading.load_all(load_Txx_at_time,
+                                        [(directory,time,file_name) \
+                                             for directory in directory_list],
+                                        workers)
+    positions_list = [result[0] for result in results]
+    Txx_list = [result[1] for result in results]
+    time_index_list = [result[2] for result in results]
+    h_list = [result[3] for result in results]
+    num_cells_list = [result[4] for result in results]
     return positions_list,Txx_list,time_index_list,h_list,num_cells_list
 
+def load_Txx_at_time(arguments):
+    """
+    Takes a tuple (directory,time,file_name) and returns the position,
+    Txx, iteration, lattice spacing and number of cells for that
+    directory, as in get_Txx_data.
+
+    This is what the workers in get_Txx_data run.
+    """
+    directory,time,file_name = arguments
+    # Only read the snapshot at this time. Raises an error if
+    # the appropriate time doesn't exist
+    tensor_data,h,num_cells = generate_resolution_and_physical_data(directory,
+                                                                    RESTART_NUMBER,
+                                                                    file_name,
+                                                                    multipatch.time_window(time))
+    snapshot_index = tensor_data.find_time(time)
+    time_index = tensor_data.iterations[snapshot_index]
+    position,Txx=multipatch.element_of_physical_position_at_time(E_INDEX[0],E_INDEX[1],COORD,
+                                                                 snapshot_index,
+                                                                 tensor_data)
+    return position,Txx,time_index,h,num_cells
+
 def plot_Txx(function,positions_list,Txx_list,num_cells_list,ylabel,time):
     """
     Plots the theoretical value for Txx at the time (not time index)
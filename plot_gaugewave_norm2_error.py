@@ -23,6 +23,7 @@ import simfactory_interface as interface # for simfactory support
 import plot_gaugewave_multipatch as pgm
 import plot_gaugewave as pg
 import find_times
+import parallel_loading # To load many simulations at once
 # ----------------------------------------------------------------------
 
 # Global Constants
@@ -41,7 +42,8 @@ EXPONENT = pg.EXPONENT
 SimData = namedtuple('SimData',['snapshots','h','num_cells','shared_indices'])
 # ----------------------------------------------------------------------
 
-def get_data(directory_list,file_name=False):
+def get_data(directory_list,file_name=False,
+             workers=parallel_loading.LOAD_WORKERS):
     """
     Takes a list of directories and outputs a list of SimData objects,
     each for a different simulation. Each object contains:
@@ -62,25 +64,55 @@ def get_data(directory_list,file_name=False):
 
     Shared indexes is a dictionary for each simulation mapping shared
     times to the iteration index associated with them.
+
+    The directories are read at the same time by up to workers
+    processes, as many as fit in memory (see parallel_loading.py).
     """
-    simulations = [None]*len(directory_list)
     shared_times = find_times.get_time_intersections_from_directories(directory_list)
-    shared_times = [float('%.10f' % time) for time in shared_times]
-    for i in range(len(directory_list)):
-        directory = directory_list[i]
-        tensor_data,coordinate_maps,h,num_cells = pgm.generate_map_resolution_and_tensor_data(directory,pgm.RESTART_NUMBER,file_name)
-        snapshots_list = []
-        shared_indices = {}
-        for time_index in range(len(tensor_data)):
-            time = float('%.10f' % tensor_data[time_index][0][-3])
-            if time in shared_times:
-                shared_indices[time] = time_index
-            positions,elements = multipatch.element_of_position_at_time(pgm.E_INDEX[0],pgm.E_INDEX[1],pgm.COORD,time_index,tensor_data,coordinate_maps)
-            snapshots_list.append([time,positions,elements])
-        simulations[i] = SimData(snapshots_list,h,num_cells,shared_indices)
+    job_memory = [estimated_memory(directory,file_name) \
+                      for directory in directory_list]
+    results = parallel_loading.load_all(load_simulation,
+                                        [(directory,file_name,shared_times) \
+                                             for directory in directory_list],
+                                        workers,job_memory)
+    simulations = [SimData(parallel_loading.unpack_evolution(evolution),
+                           h,num_cells,shared_indices) \
+                       for evolution,h,num_cells,shared_indices in results]
     simulations.sort(key=lambda simulation: simulation.num_cells)
     return simulations,shared_times
 
+def load_simulation(arguments):
+    """
+    Takes a tuple (directory,file_name,shared_times) and returns the
+    pieces of a SimData for that directory. The snapshots come packed
+    in a parallel_loading.Evolution.
+
+    This is what the workers in get_data run.
+    """
+    directory,file_name,shared_times = arguments
+    tensor_data,h,num_cells = pgm.generate_resolution_and_physical_data(directory,pgm.RESTART_NUMBER,file_name)
+    # Every snapshot is sorted at once
+    evolution = multipatch.element_of_physical_position_of_time(pgm.E_INDEX[0],pgm.E_INDEX[1],pgm.COORD,tensor_data)
+    # Binary search for each shared time, give or take a little
+    # floating point error
+    shared_indices = {}
+    for time in shared_times:
+        try:
+            shared_indices[time] = tensor_data.find_time(time)
+        except ValueError:
+            pass
+    return evolution,h,num_cells,shared_indices
+
+def estimated_memory(directory,file_name=False):
+    """
+    Estimates how many bytes of memory load_simulation needs for
+    directory.
+    """
+    paths = interface.get_file_paths(directory,pgm.RESTART_NUMBER,file_name)
+    # The tensor data and the coordinates
+    return sum([parallel_loading.estimated_memory(path) \
+                    for path in paths[1:3]])
+
 def make_norm2_error(function,positions,elements,time,h):
     """
     Given a function for the analytic solution and the grid spacing
@@ -18,6 +18,7 @@ python2 plot_gaugewave_of_time.py *.metric.x.asc
 import numpy as np # For array support
 import extract_tensor_data as etd # For tensor support
 import plot_gaugewave as pg
+import parallel_loading # To load many files at once
 # Optimization tools
 from scipy.optimize import curve_fit
 # Plot tools
@@ -63,7 +64,8 @@ def gaugewave_kxx(x,t,A,D):
     return numerator/denominator
 
 
-def get_Tij_data_of_index(i,j,coord,filename_list):
+def get_Tij_data_of_index(i,j,coord,filename_list,
+                          workers=parallel_loading.LOAD_WORKERS):
     """
     Takes a list of filenames (strings) and generates a list of
     "evolutions." Each evolution is a list containing snapshots for a
@@ -78,19 +80,65 @@ def get_Tij_data_of_index(i,j,coord,filename_list):
     The function also returns an "h_list" containing the lattice
     spacing of the grid in the file for each file. Ordering is the
     same as filename list.
+
+    The files are read at the same time by up to workers processes
+    (see parallel_loading.py). Each file is streamed, so there is no
+    memory cap.
+    """
+    results = parallel_loading.load_all(load_Tij_evolution,
+                                        [(i,j,coord,filename) \
+                                             for filename in filename_list],
+                                        workers)
+    evolutions_list = [parallel_loading.unpack_evolution(result[0]) \
+                           for result in results]
+    h_list = [result[1] for result in results]
+    return evolutions_list,h_list
+
+
+def load_Tij_evolution(arguments):
+    """
+    Takes a tuple (i,j,coord,filename) and returns the evolution of
+    the file, packed in a parallel_loading.Evolution, and its lattice
+    spacing.
+
+    This is what the workers in get_Tij_data_of_index run.
+    """
+    i,j,coord,filename = arguments
+    evolutions = []
+    # Stream the file so only one full snapshot is in memory
+    h = append_Tij_data(i,j,coord,etd.iterate_snapshots(filename),evolutions)
+    return parallel_loading.pack_evolution(evolutions),h
+
+
+def append_Tij_data(i,j,coord,snapshots,evolutions,h=None):
+    """
+    Appends [time,positions,Tijs] for each snapshot in snapshots to
+    evolutions, as in get_Tij_data_of_index. Returns the lattice
+    spacing, which is h if h is given.
+    """
+    for snapshot in snapshots:
+        if h is None:
+            h = etd.get_lattice_spacing([snapshot])
+        time = snapshot[0][4]
+        positions,Tijs = etd.element_of_position_at_snapshot(i,j,coord,
+                                                             snapshot)
+        evolutions.append([time,positions,Tijs])
+    return h
+
+
+def update_Tij_data_of_index(i,j,coord,followers,evolutions_list,h_list):
+    """
+    Like get_Tij_data_of_index, but for simulations that are still
+    running. followers is a list of etd.Follower objects, one per
+    file. Each call only reads the snapshots written since the last
+    call and appends them to evolutions_list and h_list, which start
+    out as lists of empty lists and Nones.
     """
-    evolutions_list = []
-    h_list = []
-    for filename in filename_list:
-        evolutions = []
-        data = etd.extract_data(filename)
-        for snapshot in data:
-            time = snapshot[0][4]
-            positions,Tijs = etd.element_of_position_at_snapshot(i,j,coord,
-                                                                 snapshot)
-            evolutions.append([time,positions,Tijs])
-        evolutions_list.append(evolutions)
-        h_list.append(etd.get_lattice_spacing(data))
+    for k in range(len(followers)):
+        new_snapshots = followers[k].update()
+        if new_snapshots is not None:
+            h_list[k] = append_Tij_data(i,j,coord,new_snapshots,
+                                        evolutions_list[k],h_list[k])
     return evolutions_list,h_list
 
 
@@ -37,6 +37,7 @@ import extract_tensor_data_multipatch as multipatch
 import simfactory_interface as interface
 import plot_gaugewave_multipatch as pgm
 import plot_robust_stability_at_time as prst
+import parallel_loading # To read the data and coordinates at once
 # ----------------------------------------------------------------------
 
 def get_Txy_data(time,directory_list,file_name=False):
@@ -59,17 +60,17 @@ def get_Txy_data(time,directory_list,file_name=False):
 
     This method is adapted for multipatch.
     """
-    time = float('%.10f' % time)
     positions_list = []
     Txy_list = []
     time_index_list = []
     h_list = []
     num_cells_list = []
     for directory in directory_list:
-        tensor_data,coordinate_maps,h,num_cells = pgm.generate_map_resolution_and_tensor_data(directory,pgm.RESTART_NUMBER,file_name)
-        times = [float('%.10f' % snapshot[0][4]) for snapshot in tensor_data]
-        time_index = times.index(time) # Raises an error if the appropriate time doesn't exist
-        position,Txy = multipatch.element_of_position_at_time(prst.T_INDEX[0],prst.T_INDEX[1],prst.COORD,time_index,tensor_data,coordinate_maps)
+        # Only read the snapshot at this time
+        tensor_data,h,num_cells = pgm.generate_resolution_and_physical_data(directory,pgm.RESTART_NUMBER,file_name,multipatch.time_window(time),parallel_loading.LOAD_WORKERS)
+        snapshot_index = tensor_data.find_time(time) # Raises an error if the appropriate time doesn't exist
+        time_index = tensor_data.iterations[snapshot_index]
+        position,Txy = multipatch.element_of_physical_position_at_time(prst.T_INDEX[0],prst.T_INDEX[1],prst.COORD,snapshot_index,tensor_data)
         time_index_list.append(time_index)
         positions_list.append(position)
         Txy_list.append(Txy)
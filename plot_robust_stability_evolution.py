@@ -21,6 +21,7 @@ import sys # command line IO
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 import simfactory_interface as interface
+import compressed_files # For archived (compressed) output
 import plot_gaugewave_multipatch as pgm
 # ----------------------------------------------------------------------
 
@@ -55,7 +56,8 @@ def get_resolution_and_tensor_data(directory_name,
     coordinates_path = paths[2]
     parameter_path = paths[3]
     # Extract the data
-    tensor_data = np.loadtxt(tensor_path).transpose()
+    with compressed_files.open_file(tensor_path) as f:
+        tensor_data = np.loadtxt(f).transpose()
     number_of_cells = interface.extract_parameter_value(parameter_path,
                                                         RESOLUTION_PARAMETER_STRING,
                                                         True)
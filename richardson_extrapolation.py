@@ -44,6 +44,7 @@ import matplotlib.pyplot as plt
 # ----------------------------------------------------------------------
 COORD = 0 # The coordinate along which the projection is based
 E_INDEX=(0,0) # The component of the tensor we care about.
+LEVELS = etd.FINEST # The finest data available at every point
 LINEWIDTH=5 # The plot linewidth
 FONTSIZE=20 # The plot font size
 PLOT_TITLE="Self Convergence Test at Time t = {}\norder = {}"
@@ -82,8 +83,8 @@ def get_tensor_data(time,filename_list):
     contains data the xx-element of the symmetric tensor we wish to
     investigate for each file.
 
-    time_index_list defines the time iteration at which the data is
-    extracted.
+    time_index_list holds the iteration (the Cactus iteration number)
+    at which the data is extracted. Only that one snapshot is read.
 
     Also returns lattice spacing, which is the spacing between
     points. We call the lattice spacing h. Returns a list, h for every
@@ -96,12 +97,16 @@ def get_tensor_data(time,filename_list):
     time_index_list = []
     h_list = []
     for filename in filename_list:
-        data = etd.extract_data(filename)
-        times = [snapshot[0][4] for snapshot in data]
-        # time_index = etd.find_largest_index_of_subvalue(times,time)
-        time_index = times.index(time) # Raises error if times are not exact
+        # We only need one component and the positions at one time
+        data = etd.extract_data(filename,components=[E_INDEX],
+                                fields=etd.SPACING_FIELDS,
+                                times=etd.time_window(time),
+                                levels=LEVELS)
+        snapshot_index = data.find_time(time) # Raises error if time is missing
+        time_index = data.iterations[snapshot_index]
         position,tensor=etd.element_of_position_at_time(E_INDEX[0], E_INDEX[1],
-                                                     COORD, time_index, data)
+                                                     COORD, snapshot_index,
+                                                     data)
         time_index_list.append(time_index)
         positions_list.append(position)
         tensor_list.append(tensor)
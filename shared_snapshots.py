@@ -0,0 +1,177 @@
+"""
+shared_snapshots.py
+
+When we fan an analysis out over worker processes, every worker used
+to parse (or unpickle) its own copy of the same data. This little
+library puts a loaded Snapshots store (see extract_tensor_data.py) in
+shared memory once, so any number of processes can read it without
+copying it.
+----------------------------------------------------------------------
+
+The parent publishes a store under a name,
+
+shared = shared_snapshots.publish(data)
+
+and a worker attaches to it by that name,
+
+data = shared_snapshots.attach(shared.name)
+
+The attached store is a normal Snapshots object, but its columns are
+read-only memory maps of the published ones. Nothing is copied until
+a worker makes a new array out of them. The SharedSnapshots handle
+itself only holds the name, so it's cheap to pass to the workers
+instead of the data.
+
+A published store is a directory in SHARED_MEMORY_DIRECTORY (/dev/shm,
+which lives in memory, if there is one) holding one .npy file per
+column and a manifest, written last, with the schema and the process
+id of the owner. The owner removes it when it calls close(), when it
+leaves a with statement, or when it exits. If the owner is killed
+before it can clean up, the next call to publish removes the
+leftovers.
+"""
+
+# Imports
+# ----------------------------------------------------------------------
+import os # File system tools
+import errno # To tell why os.kill failed
+import shutil # To remove published stores
+import tempfile # To find a place for them if there's no /dev/shm
+import atexit # To clean up when the owner exits
+import json # For the manifest
+import numpy as np # For arrays
+import extract_tensor_data as etd # For the store
+# ----------------------------------------------------------------------
+
+# Global constants
+# ----------------------------------------------------------------------
+if os.path.isdir('/dev/shm'):
+    SHARED_MEMORY_DIRECTORY = '/dev/shm'
+else:
+    SHARED_MEMORY_DIRECTORY = tempfile.gettempdir()
+NAME_PREFIX = 'cactus_snapshots_'
+MANIFEST_NAME = 'manifest.json'
+COLUMN_SUFFIX = '.npy'
+WARNING_MESSAGE = "This is a library. You are only supposed to import it!"
+# ----------------------------------------------------------------------
+
+def shared_path(name):
+    "Returns the path to the store published under name."
+    return os.path.join(SHARED_MEMORY_DIRECTORY,name)
+
+def is_running(pid):
+    "True if a process with the given id is running."
+    try:
+        os.kill(pid,0)
+    except OSError as error:
+        # EPERM means it's running, but isn't ours
+        return error.errno == errno.EPERM
+    return True
+
+def read_manifest(name):
+    """
+    Returns the manifest of the store published under name, or None
+    if there isn't a complete one.
+    """
+    try:
+        with open(os.path.join(shared_path(name),MANIFEST_NAME),'r') as f:
+            return json.load(f)
+    except (IOError,OSError,ValueError):
+        return None
+
+def remove_stale():
+    """
+    Removes the stores whose owners have exited without cleaning up.
+    """
+    for name in os.listdir(SHARED_MEMORY_DIRECTORY):
+        if not name.startswith(NAME_PREFIX):
+            continue
+        manifest = read_manifest(name)
+        if manifest is not None and not is_running(manifest['owner']):
+            shutil.rmtree(shared_path(name),ignore_errors=True)
+
+
+class SharedSnapshots(object):
+    """
+    A handle on a store published with publish. Only the process that
+    published it owns it. close() removes the store if we own it and
+    does nothing otherwise. Can be used in a with statement.
+    """
+    def __init__(self,name,owner=None):
+        self.name = name
+        self.owner = owner
+
+    def attach(self):
+        "Same as attach(self.name)."
+        return attach(self.name)
+
+    def close(self):
+        "Removes the store, if this process owns it."
+        if self.owner == os.getpid():
+            shutil.rmtree(shared_path(self.name),ignore_errors=True)
+            self.owner = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exception):
+        self.close()
+
+    def __getstate__(self):
+        # Whoever unpickles a handle doesn't own the store
+        return {'name' : self.name, 'owner' : None}
+
+    def __setstate__(self,state):
+        self.__dict__.update(state)
+
+
+def publish(data,name=None):
+    """
+    Copies the Snapshots store data into shared memory and returns a
+    SharedSnapshots handle on it. name defaults to a new unique
+    name. The store is removed when the handle is closed or this
+    process exits.
+    """
+    remove_stale()
+    if name is None:
+        path = tempfile.mkdtemp(prefix=NAME_PREFIX,
+                                dir=SHARED_MEMORY_DIRECTORY)
+        name = os.path.basename(path)
+    else:
+        path = shared_path(name)
+        os.mkdir(path)
+    shared = SharedSnapshots(name,os.getpid())
+    atexit.register(shared.close)
+    arrays = data.to_arrays()
+    try:
+        for column,array in arrays.items():
+            np.save(os.path.join(path,column + COLUMN_SUFFIX),
+                    np.ascontiguousarray(array))
+        manifest = {'owner' : shared.owner,
+                    'columns' : sorted(arrays.keys()),
+                    'schema' : dict(data.schema._asdict())}
+        with open(os.path.join(path,MANIFEST_NAME),'w') as f:
+            json.dump(manifest,f)
+    except:
+        shared.close()
+        raise
+    return shared
+
+def attach(name):
+    """
+    Returns the Snapshots store published under name. Its arrays are
+    read-only memory maps of the shared ones. Raises an IOError if
+    there is no such store.
+    """
+    manifest = read_manifest(name)
+    if manifest is None:
+        raise IOError("No snapshots are published as {}.".format(name))
+    arrays = {column : np.load(os.path.join(shared_path(name),
+                                            column + COLUMN_SUFFIX),
+                               mmap_mode='r') \
+                  for column in manifest['columns']}
+    return etd.snapshots_from_arrays(arrays,etd.Schema(**manifest['schema']))
+
+
+if __name__=="__main__":
+    raise ImportWarning(WARNING_MESSAGE)
@@ -5,12 +5,20 @@ Time-stamp: <2014-03-11 12:21:09 (jonah)>
 
 This is a small library that uses the directory structure of a cactus
 simulation generated by simfactory to make things a little easier.
+
+A simulation that was checkpointed and restarted has one output
+directory per restart: output-0000, output-0001, and so on. Timeline
+stitches the files of every restart together into one continuous
+evolution.
 """
 
 # Imports
 # ----------------------------------------------------------------------
 import os # File system tools
 import re # Regular expressions
+import numpy as np # For arrays
+import compressed_files # For archived (compressed) output
+import extract_tensor_data as etd # To stitch restarts together
 # ----------------------------------------------------------------------
 
 # Global constants
@@ -22,12 +30,18 @@ UNDESIRABLE_DIRECTORIES = ["SIMFACTORY"]
 GRID_PREFACTOR='grid::'
 ADM_PREFACTOR='admbase::'
 ASCII_POSTFACTOR='.asc'
+HDF5_POSTFACTOR='.h5'
 METRIC_NORM2=ADM_PREFACTOR+'metric.norm2'+ASCII_POSTFACTOR
 # projections along the x-axis
 METRIC_XPROJ=ADM_PREFACTOR+'metric.x'+ASCII_POSTFACTOR
 CURV_XPROJ=ADM_PREFACTOR+'curv.x'+ASCII_POSTFACTOR
 COORDS_XPROJ=GRID_PREFACTOR+'coordinates.x'+ASCII_POSTFACTOR
 PAR_FILE_POSTFACTOR=".par"
+# The name of the output directory of each restart
+RESTART_DIRECTORY = re.compile(r'^output-(\d{4})$')
+# Stands for etd.DUPLICATE_RULE, looked up when a Timeline is built,
+# since None already means keep every row
+DEFAULT_DUPLICATES = 'default'
 # ----------------------------------------------------------------------
 
 def restart_dir_name(value):
@@ -44,11 +58,13 @@ def get_data_directory(root_dir_name,restart_number):
     target_dirs = []
     # to ensure there's only one /
     path = root_dir_name.rstrip('/')+'/'+restart_dir_name(restart_number)+'/'
-    # Find the name of the directory we want
-    for root,dirs,files in os.walk(path):
-        for directory in dirs:
-            if directory not in UNDESIRABLE_DIRECTORIES:
-                target_dirs.append(directory)
+    # Find the name of the directory we want. Only look at the top
+    # level, so directories inside it (like the sidecar caches of
+    # extract_tensor_data.py) don't count.
+    root,dirs,files = next(os.walk(path))
+    for directory in dirs:
+        if directory not in UNDESIRABLE_DIRECTORIES:
+            target_dirs.append(directory)
     assert len(target_dirs) == 1 and "There should only be 1 target directory"
     target_dir = target_dirs[0]
     path += target_dir + '/'
@@ -61,6 +77,11 @@ def get_file_paths(root_dir_name,restart_number,file_name=False):
     for the simulation, the metric projected along x for this
     simulation, the curvature along x for this simulation, and the
     coordinates along x for this simulation.
+
+    If a data file has been compressed (e.g., to
+    admbase::metric.x.asc.gz), the path to the compressed file is
+    returned instead. If the simulation wrote HDF5 instead of ASCII,
+    the path to the HDF5 file (e.g., admbase::metric.x.h5) is returned.
     """
     data_directory = get_data_directory(root_dir_name,restart_number)
     parameter_file_name = data_directory.rstrip('/').split('/')[-1] + PAR_FILE_POSTFACTOR
@@ -71,8 +92,174 @@ def get_file_paths(root_dir_name,restart_number,file_name=False):
         tensor_path = data_directory + file_name
     else:
         tensor_path = metric_path
+    tensor_path = find_data_file(tensor_path)
+    coordinates_path = find_data_file(coordinates_path)
     return data_directory,tensor_path,coordinates_path,parameter_path
 
+def find_data_file(path):
+    """
+    Returns path if the file exists, or else a compressed version of
+    it (see compressed_files.find_file), or else the HDF5 version of
+    an ASCII file if that exists. If none of them do, returns path.
+    """
+    found = compressed_files.find_file(path)
+    if os.path.exists(found) or not path.endswith(ASCII_POSTFACTOR):
+        return found
+    hdf5_path = path[:-len(ASCII_POSTFACTOR)] + HDF5_POSTFACTOR
+    if os.path.exists(hdf5_path):
+        return hdf5_path
+    return found
+
+def get_restart_numbers(root_dir_name):
+    """
+    Returns the numbers of every restart of the simulation in
+    root_dir_name, in order.
+    """
+    numbers = []
+    for name in os.listdir(root_dir_name):
+        match = RESTART_DIRECTORY.match(name)
+        if match and os.path.isdir(os.path.join(root_dir_name,name)):
+            numbers.append(int(match.group(1)))
+    numbers.sort()
+    return numbers
+
+def get_restart_file_paths(root_dir_name,file_name=METRIC_XPROJ):
+    """
+    Returns the path to file_name in every restart of the simulation
+    in root_dir_name that has it, in restart order. Compressed files
+    and HDF5 files count.
+    """
+    paths = []
+    for restart_number in get_restart_numbers(root_dir_name):
+        data_directory = get_data_directory(root_dir_name,restart_number)
+        path = find_data_file(data_directory + file_name)
+        if os.path.exists(path):
+            paths.append(path)
+    return paths
+
+def drop_overlaps(iterations_list):
+    """
+    Takes a list with the iterations output by each restart, in
+    order, and returns a list of boolean masks of the iterations to
+    keep.
+
+    A restart recovers from the last checkpoint of the one before it,
+    so it repeats the iterations between that checkpoint and the end
+    of the previous restart. The newer restart wins: each restart only
+    keeps the iterations before the first iteration of every later
+    restart.
+    """
+    masks = []
+    first_later = None
+    for iterations in reversed(iterations_list):
+        iterations = np.asarray(iterations)
+        if first_later is None:
+            masks.append(np.ones(len(iterations),dtype=bool))
+        else:
+            masks.append(iterations < first_later)
+        if len(iterations) > 0:
+            first = iterations.min()
+            first_later = first if first_later is None \
+                else min(first,first_later)
+    masks.reverse()
+    return masks
+
+class Timeline(object):
+    """
+    The output file file_name of every restart of the simulation in
+    root_dir_name, seen as one continuous evolution. The iterations
+    repeated after a checkpoint recovery are dropped (see
+    drop_overlaps).
+
+    Only the headers of the files are read up front (and that index
+    is cached if use_cache is true, see etd.get_iteration_offsets).
+    Data is read from each restart only when it's needed:
+
+    timeline[k] is the kth snapshot of the evolution;
+    iterating over the timeline streams one snapshot at a time;
+    timeline.load() reads the whole evolution, or the windows of
+    iterations and times given (see etd.make_window), into one
+    Snapshots store.
+
+    duplicates, components and fields are passed to the readers in
+    extract_tensor_data.py. duplicates defaults to etd.DUPLICATE_RULE.
+    """
+    def __init__(self,root_dir_name,file_name=METRIC_XPROJ,
+                 duplicates=DEFAULT_DUPLICATES,components=None,fields=None,
+                 use_cache=etd.USE_CACHE):
+        self.paths = get_restart_file_paths(root_dir_name,file_name)
+        if not self.paths:
+            raise IOError("No restart of {} has {}".format(root_dir_name,
+                                                           file_name))
+        if duplicates == DEFAULT_DUPLICATES:
+            duplicates = etd.DUPLICATE_RULE
+        self.use_cache = use_cache
+        self.options = {'duplicates' : duplicates,
+                        'components' : components,
+                        'fields' : fields}
+        indices = [etd.get_snapshot_index(path,use_cache) \
+                       for path in self.paths]
+        self.masks = drop_overlaps([index['iterations'] \
+                                        for index in indices])
+        self.iterations = np.concatenate([index['iterations'][mask] \
+                                              for index,mask \
+                                              in zip(indices,self.masks)])
+        self.times = np.concatenate([index['times'][mask] \
+                                         for index,mask \
+                                         in zip(indices,self.masks)])
+        # Where to find each snapshot of the timeline
+        self.restarts = np.concatenate([np.repeat(k,np.sum(mask)) \
+                                            for k,mask \
+                                            in enumerate(self.masks)])
+        self.local_indices = np.concatenate([np.flatnonzero(mask) \
+                                                 for mask in self.masks])
+
+    def __len__(self):
+        return len(self.iterations)
+
+    def __getitem__(self,index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Snapshot index out of range.")
+        return etd.extract_snapshot(self.paths[self.restarts[index]],
+                                    self.local_indices[index],
+                                    use_cache=self.use_cache,
+                                    **self.options)
+
+    def __iter__(self):
+        for path,mask in zip(self.paths,self.masks):
+            snapshots = etd.iterate_snapshots(path,**self.options)
+            for k,snapshot in enumerate(snapshots):
+                if k >= len(mask):
+                    break
+                if mask[k]:
+                    yield snapshot
+
+    def load(self,iterations=None,times=None,use_cache=etd.USE_CACHE):
+        """
+        Reads the snapshots of the timeline inside the windows of
+        iterations and times (all of them by default) and returns them
+        as one Snapshots store. Only the restarts that hold some of
+        them are read.
+        """
+        selected = etd.select_window(self.iterations,self.times,
+                                     iterations,times)
+        stores = []
+        for k,path in enumerate(self.paths):
+            wanted = self.iterations[selected[self.restarts[selected] == k]]
+            if len(wanted) == 0:
+                continue
+            if len(wanted) == len(self.masks[k]):
+                data = etd.extract_data(path,use_cache,**self.options)
+            else:
+                data = etd.extract_data(path,use_cache,
+                                        iterations=(wanted[0],wanted[-1]),
+                                        **self.options)
+            keep = np.isin(data.iterations,wanted)
+            stores.append(data.select_snapshots(np.flatnonzero(keep)))
+        return etd.join_snapshots(stores)
+
 def extract_parameter_value(parameter_file_name,parameter_name,parameter_is_number=True):
     """
     Given the name of a parameter file and the name of a parameter in it, extracts the
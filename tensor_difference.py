@@ -78,14 +78,15 @@ def print_difference(iteration1,iteration2,filename1,filename2):
     the snapshot. This information comes from filename 1 and is
     assumed to be the same.
     """
-    data1 = etd.extract_data(filename1)
-    data2 = etd.extract_data(filename2)
-    time1 = data1[iteration1][0][4]
-    time2 = data2[iteration2][0][4]
-    difference = tensor_difference(iteration1,iteration2,data1,data2)
+    # Only the two snapshots we compare are read into memory
+    snapshot1 = etd.extract_snapshot(filename1,iteration1)
+    snapshot2 = etd.extract_snapshot(filename2,iteration2)
+    time1 = snapshot1[0][4]
+    time2 = snapshot2[0][4]
+    difference = tensor_difference(0,0,[snapshot1],[snapshot2])
     print HEADER_INFO.format(iteration1,time1,iteration2,time2)
-    for i in range(len(data1[iteration1])):
-        outlist = copy(data1[iteration1][i])
+    for i in range(len(snapshot1)):
+        outlist = copy(snapshot1[i])
         outlist[-1] = "{}".format(np.max(np.abs(difference[i])))
         outstring = reduce(lambda x,y: "{} {}".format(x,y), outlist)
         print outstring
@@ -0,0 +1,119 @@
+"""
+test_follower.py
+
+Checks that extract_tensor_data.Follower copes with a file that ends
+partway through an '# iteration' header, like one Cactus is still
+writing, and that accumulate only looks at new snapshots. Run it with
+
+python -m unittest test_follower
+"""
+
+# Imports
+# ----------------------------------------------------------------------
+import os # File system tools
+import shutil # To clean up
+import tempfile # For the test files
+import unittest
+import extract_tensor_data as etd
+# ----------------------------------------------------------------------
+
+# Global constants
+# ----------------------------------------------------------------------
+NUM_ITERATIONS = 3
+NUM_POINTS = 4
+HEADER = ("# iteration {0}   time {1}\n"
+          "# time level 0\n"
+          "# refinement level 0   multigrid level 0   map 0   component 0\n"
+          "# column format: 1:it\t2:tl\t3:rl 4:c 5:ml\t6:ix 7:iy 8:iz\t9:time"
+          "\t10:x 11:y 12:z\t13:data\n"
+          "# data columns: 13:gxx 14:gxy 15:gxz 16:gyy 17:gyz 18:gzz\n")
+ROW = "{0}\t0\t0 0 0\t{1} 0 0\t{2}\t{3} 0 0\t1 0 0 1 0 1\n"
+# Where the file is cut, as the start of the header of the last
+# iteration
+CUTS = ["# iteration",
+        "# iteration ",
+        "# iteration {}   time".format(NUM_ITERATIONS-1),
+        "# iteration {}   time 0.5".format(NUM_ITERATIONS-1),
+        "# iteration {}   time 0.5\n# time lev".format(NUM_ITERATIONS-1)]
+# ----------------------------------------------------------------------
+
+def make_text():
+    "Returns the text of a small CarpetIOASCII file."
+    blocks = []
+    for iteration in range(NUM_ITERATIONS):
+        time = 0.25*iteration
+        rows = [ROW.format(iteration,ix,time,0.1*ix) \
+                    for ix in range(NUM_POINTS)]
+        blocks.append(HEADER.format(iteration,time) + ''.join(rows) + "\n\n")
+    return ''.join(blocks)
+
+
+class TestCutHeader(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory,'metric.x.asc')
+        self.text = make_text()
+        self.last = self.text.index("# iteration {}".format(NUM_ITERATIONS-1))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self,text):
+        with open(self.filename,'w') as f:
+            f.write(text)
+
+    def test_cut_header(self):
+        for cut in CUTS:
+            self.write(self.text[:self.last] + cut)
+            follower = etd.Follower(self.filename)
+            data = follower.update()
+            self.assertEqual(list(data.iterations),[0])
+            data = follower.update(final=True)
+            self.assertEqual(list(data.iterations),[1])
+            # Once the rest is written, it's picked up
+            self.write(self.text)
+            data = follower.update(final=True)
+            self.assertEqual(list(data.iterations),[NUM_ITERATIONS-1])
+            self.assertEqual(len(data[0]),NUM_POINTS)
+
+    def test_scan_stops_at_cut_header(self):
+        for cut in CUTS:
+            self.write(self.text[:self.last] + cut)
+            index = etd.scan_iteration_offsets(self.filename)
+            self.assertEqual(list(index['iterations']),[0,1])
+            self.assertEqual(index['offsets'][-1],self.last)
+
+
+class TestAccumulate(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory,'metric.x.asc')
+        self.text = make_text()
+        self.starts = [self.text.index("# iteration {}".format(k)) \
+                           for k in range(NUM_ITERATIONS)]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_only_new_snapshots(self):
+        follower = etd.Follower(self.filename)
+        seen = []
+        def count(data):
+            seen.append(list(data.iterations))
+            return data.times()
+        for start in self.starts[1:] + [len(self.text)]:
+            with open(self.filename,'w') as f:
+                f.write(self.text[:start])
+            follower.update()
+            follower.accumulate('times',count)
+        follower.update(final=True)
+        times = follower.accumulate('times',count)
+        # Each snapshot is handed to function once
+        self.assertEqual(seen,[[k] for k in range(NUM_ITERATIONS)])
+        self.assertEqual(list(times),list(follower.data().times()))
+        self.assertEqual(list(follower.data().iterations),
+                         list(range(NUM_ITERATIONS)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+"""
+test_levels.py
+
+Checks the refinement level and time level selection of
+extract_tensor_data on a small mesh refined file with a past time
+level, like Carpet writes with output_all_timelevels. Run it with
+
+python -m unittest test_levels
+"""
+
+# Imports
+# ----------------------------------------------------------------------
+import os # File system tools
+import shutil # To clean up
+import tempfile # For the test files
+import unittest
+import numpy as np
+import extract_tensor_data as etd
+# ----------------------------------------------------------------------
+
+# Global constants
+# ----------------------------------------------------------------------
+NUM_ITERATIONS = 2
+HEADER = ("# iteration {0}   time {1}\n"
+          "# time level {2}\n"
+          "# refinement level {3}   multigrid level 0   map 0   component 0\n"
+          "# column format: 1:it\t2:tl\t3:rl 4:c 5:ml\t6:ix 7:iy 8:iz\t9:time"
+          "\t10:x 11:y 12:z\t13:data\n"
+          "# data columns: 13:gxx 14:gxy 15:gxz 16:gyy 17:gyz 18:gzz\n")
+ROW = "{0}\t{1}\t{2} 0 0\t{3} 0 0\t{4}\t{5} 0 0\t{6} 0 0 1 0 1\n"
+# The coarse level covers [0,0.9] with spacing 0.1, the fine level
+# covers [0.2,0.5] with spacing 0.05
+LEVELS = {0 : (0.1,range(0,10)), 1 : (0.05,range(4,11))}
+TIME_LEVELS = [0,1]
+# The past time level holds different values, so we can tell them apart
+PAST_OFFSET = 100.0
+# ----------------------------------------------------------------------
+
+def make_text():
+    "Returns the text of the test file."
+    blocks = []
+    for iteration in range(NUM_ITERATIONS):
+        time = 0.25*iteration
+        for rl in sorted(LEVELS):
+            h,indices = LEVELS[rl]
+            for tl in TIME_LEVELS:
+                rows = [ROW.format(iteration,tl,rl,ix,time,h*ix,
+                                   h*ix + PAST_OFFSET*tl) \
+                            for ix in indices]
+                blocks.append(HEADER.format(iteration,time,tl,rl) \
+                                  + ''.join(rows) + "\n\n")
+    return ''.join(blocks)
+
+
+class TestLevels(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory,'metric.x.asc')
+        with open(self.filename,'w') as f:
+            f.write(make_text())
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_time_levels_kept(self):
+        data = etd.extract_data(self.filename,use_cache=False)
+        self.assertEqual(list(data.time_levels()),TIME_LEVELS)
+        self.assertEqual(list(data.refinement_levels()),sorted(LEVELS))
+
+    def test_finest(self):
+        data = etd.extract_data(self.filename,use_cache=False,
+                                levels=etd.FINEST)
+        self.assertEqual(len(data),NUM_ITERATIONS)
+        for snapshot in data:
+            x = snapshot.column('x')
+            rl = snapshot.column('rl')
+            # One line: every position once, in order
+            self.assertTrue(np.all(np.diff(x) > 0))
+            self.assertEqual(list(np.unique(snapshot.column('tl'))),
+                             [etd.CURRENT_TIME_LEVEL])
+            # The current values, not the past ones
+            self.assertTrue(np.allclose(snapshot.elements(0,0),x))
+            # The fine level wins where it exists
+            self.assertTrue(np.allclose(x[rl == 1],
+                                        0.05*np.array(LEVELS[1][1])))
+            self.assertFalse(np.any((rl == 0) & (x >= 0.2) & (x <= 0.5)))
+
+    def test_finest_with_fields(self):
+        data = etd.extract_data(self.filename,use_cache=False,
+                                fields=['x'],levels=etd.FINEST)
+        self.assertTrue(np.all(np.diff(data[0].column('x')) > 0))
+
+    def test_select_time_levels(self):
+        data = etd.extract_data(self.filename,use_cache=False)
+        past = data.select_levels(levels=[1],time_levels=[1])
+        self.assertEqual(len(past[0]),len(LEVELS[1][1]))
+        self.assertTrue(np.all(past[0].elements(0,0) >= PAST_OFFSET))
+
+    def test_no_cache(self):
+        etd.extract_data(self.filename,use_cache=False)
+        etd.extract_data(self.filename,use_cache=False,levels=etd.FINEST)
+        etd.extract_snapshot_at_iteration(self.filename,1,use_cache=False)
+        self.assertEqual(os.listdir(self.directory),
+                         [os.path.basename(self.filename)])
+
+    def test_lattice_spacing(self):
+        data = etd.extract_data(self.filename,use_cache=False)
+        self.assertAlmostEqual(etd.get_lattice_spacing(data),0.1)
+        self.assertAlmostEqual(etd.get_lattice_spacing(data,1),0.05)
+
+
+if __name__ == "__main__":
+    unittest.main()